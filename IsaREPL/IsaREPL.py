@@ -1,4 +1,13 @@
 import asyncio
+import collections
+import contextlib
+import copy
+import functools
+import inspect
+import socket
+import threading
+import time
+import zlib
 import msgpack as mp
 import os
 import signal
@@ -19,6 +28,96 @@ def is_list_of_strings(lst):
         return False
 
 
+# MessagePack extension types emitted by the server, cf. `REPL_Serialize.blob_ext_type`
+BLOB_EXT_TYPE = 1
+SINK_REF_EXT_TYPE = 2
+
+
+class PluginSinkRef:
+    """
+    A reference to a plugin output stored in the plugin sink file on the server
+    (see `Client.set_plugin_sink`).
+
+    Attributes:
+        path: The path of the sink file on the server
+        offset: The byte offset of the msgpack-encoded plugin output in the file
+        length: The length of the encoded plugin output in bytes
+    """
+    __slots__ = ('path', 'offset', 'length')
+
+    def __init__(self, path: str, offset: int, length: int):
+        self.path = path
+        self.offset = offset
+        self.length = length
+
+    def read(self) -> memoryview:
+        """
+        Read the raw msgpack encoding of the plugin output.
+        The sink file must be accessible from this machine, e.g., when the client
+        is co-located with the server.
+        """
+        buf = bytearray(self.length)
+        with open(self.path, 'rb') as f:
+            f.seek(self.offset)
+            n = f.readinto(buf)
+        if n != self.length:
+            raise REPLFail(f"truncated plugin sink {self.path} at offset {self.offset}")
+        return memoryview(buf)
+
+    def unpack(self):
+        """Read and decode the plugin output"""
+        return mp.unpackb(self.read(), ext_hook=_ext_hook, unicode_errors='replace')
+
+    def __repr__(self):
+        return f"PluginSinkRef(path={self.path!r}, offset={self.offset}, length={self.length})"
+
+
+def _ext_hook(code, data):
+    if code == BLOB_EXT_TYPE:
+        return memoryview(data)
+    if code == SINK_REF_EXT_TYPE:
+        return PluginSinkRef(*mp.unpackb(data))
+    return mp.ExtType(code, data)
+
+
+class HealthEvent:
+    """
+    A client lifecycle event pushed by the server to subscribers (see `Client.subscribe`).
+
+    Attributes:
+        kind: One of
+            'alive'         - the client was alive when the subscription started
+            'connected'     - a new client connected
+            'disconnected'  - the client closed its connection
+            'died'          - the worker of the client terminated abnormally; `detail` gives the reason
+            'error'         - an error was reported to the client; `detail` gives the message
+            'cancelled'     - the evaluation of the client was interrupted, as the client cancelled it
+                              or closed the connection; `detail` gives the reason
+            'killed'        - the client was killed by `Client.kill_client`, or by the server
+                              to relieve heap pressure; `detail` gives the reason in the latter case
+            'heap_pressure' - the server heap is close to its limit; `detail` describes the sample
+            'evicted'       - the server dropped the evaluation cache of `file` and the recorded
+                              histories (except 'init') to relieve heap pressure
+            'busy'          - the server refuses new connections until the pressure is relieved
+            'relieved'      - the heap pressure is relieved and new connections are accepted again
+            'terminating'   - the server process is about to terminate as the heap is exhausted
+        client_id: The ID of the client, or -1 for server-wide events like 'heap_pressure'
+        detail: A string detailing the event
+        time: The server time of the event, in milliseconds since the epoch
+    """
+    __slots__ = ('kind', 'client_id', 'detail', 'time')
+
+    def __init__(self, kind: str, client_id: int, detail: str, time: int):
+        self.kind = kind
+        self.client_id = client_id
+        self.detail = detail
+        self.time = time
+
+    def __repr__(self):
+        return (f"HealthEvent(kind={self.kind!r}, client_id={self.client_id}, "
+                f"detail={self.detail!r}, time={self.time})")
+
+
 class MessageType(IntEnum):
     """
     Message type enumeration for Isabelle output messages.
@@ -66,11 +165,22 @@ class CommandOutput:
         flags: Flags about the Isabelle state after executing the command
         level: The level of nesting context (an integer)
         state: The proof state as a string (the same content in the `State` panel)
-        plugin_output: The output of plugins
+        plugin_output: The output of plugins, a dictionary from plugin names to their outputs.
+                       Blobs are given as `memoryview`s and outputs redirected to a plugin sink
+                       as `PluginSinkRef`s.
         errors: A list of strings containing any errors raised during evaluating this command
+        timing: When timing is enabled by `Client.set_timing`, the server-side time spent on
+                this command, a dictionary from phases to (elapsed, cpu, gc) seconds.
+                Otherwise None.
+        fingerprint: When enabled by `Client.set_fingerprint`, a hex string hashing the structure
+                of the state (its level, goal, chained facts and local assumptions, modulo
+                alpha-equivalence). Equal states have equal fingerprints. Otherwise None.
+        goal_count: When enabled by `Client.set_fingerprint`, the number of subgoals
+                (0 outside proofs). Otherwise None.
     """
     def __init__(self, command: str, range: tuple, output: list, latex, flags: CommandFlags,
-                 level: int, state: str, plugin_output, errors: list):
+                 level: int, state: str, plugin_output, errors: list, timing: dict | None = None,
+                 fingerprint: str | None = None, goal_count: int | None = None):
         self.command = command
         self.range = range
         self.output = output
@@ -80,6 +190,9 @@ class CommandOutput:
         self.state = state
         self.plugin_output = plugin_output
         self.errors = errors
+        self.timing = timing
+        self.fingerprint = fingerprint
+        self.goal_count = goal_count
 
     @classmethod
     def parse(cls, output):
@@ -102,6 +215,10 @@ class CommandOutput:
             is_proof=output[3][2],
             has_goal=output[3][3]
         )
+        plugin_output = output[6]
+        timing = plugin_output.pop("\x05timing", None) if isinstance(plugin_output, dict) else None
+        fingerprint, goal_count = plugin_output.pop("\x05fingerprint", (None, None)) \
+                                  if isinstance(plugin_output, dict) else (None, None)
         # Create and return CommandOutput instance
         return cls(
             command=output[0],
@@ -111,8 +228,11 @@ class CommandOutput:
             flags=flags,
             level=output[4],
             state=output[5],
-            plugin_output=output[6],
-            errors=output[7]
+            plugin_output=plugin_output,
+            errors=output[7],
+            timing=None if timing is None else Client._parse_timing(timing),
+            fingerprint=fingerprint,
+            goal_count=goal_count
         )
 
     def __repr__(self):
@@ -122,6 +242,278 @@ class CommandOutput:
                 f"plugin_output={repr(self.plugin_output)}, errors={self.errors})")
 
 
+class _Transport(asyncio.BufferedProtocol):
+    """
+    A connection to the server, shared by `Client` and the short connections of the class methods.
+
+    The event loop receives bytes directly into a reusable buffer, which is fed by a
+    `memoryview` to the msgpack unpacker, without intermediate `bytes` objects. The buffer
+    doubles whenever a read fills it, up to `MAX_BUFFER`, so large responses take few reads,
+    and halves back when the recent messages are much smaller.
+    """
+    MIN_BUFFER = 64 * 1024
+    MAX_BUFFER = 16 * 1024 * 1024
+    SHRINK_WINDOW = 32 # messages
+
+    def __init__(self, ext_hook=None):
+        self.unpack = mp.Unpacker(unicode_errors='replace', ext_hook=ext_hook or mp.ExtType)
+        self.inflate = None # a zlib decompressor of the received bytes, if compressed
+        self._buf = bytearray(self.MIN_BUFFER)
+        self._view = memoryview(self._buf)
+        self._transport: asyncio.Transport | None = None
+        self._received = asyncio.Event()
+        self._eof = False
+        self._exc: Exception | None = None
+        self._closed = asyncio.get_running_loop().create_future()
+        self._drain_waiter: asyncio.Future | None = None
+        self.bytes_received = 0
+        self.messages_received = 0
+        self.reads = 0
+        self._started = time.monotonic()
+        self._last_message_end = 0 # `bytes_received` when the last message was unpacked
+        self._recent_max = 0 # the largest message in the current shrink window
+        self._window = 0
+
+    @classmethod
+    async def open(cls, address, ext_hook=None) -> '_Transport':
+        """
+        Connect to `address`, either `host:port` or `unix:/path` of a Unix domain socket.
+        TCP connections disable Nagle's algorithm, as the requests are mostly small.
+        """
+        loop = asyncio.get_running_loop()
+        if address.startswith('unix:'):
+            _, conn = await loop.create_unix_connection(lambda: cls(ext_hook), address[len('unix:'):])
+        else:
+            host, port = Client._parse_address(address)
+            _, conn = await loop.create_connection(lambda: cls(ext_hook), host, port)
+            sock = conn.get_extra_info('socket')
+            if sock is not None:
+                sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        return conn
+
+    # Protocol callbacks
+
+    def connection_made(self, transport):
+        self._transport = transport # type: ignore[assignment]
+
+    def get_buffer(self, sizehint):
+        return self._view
+
+    def buffer_updated(self, nbytes):
+        self.reads += 1
+        self.bytes_received += nbytes
+        data = self._view[:nbytes]
+        if self.inflate is not None:
+            data = self.inflate.decompress(data)
+        self.unpack.feed(data)
+        if nbytes == len(self._buf) and nbytes < self.MAX_BUFFER:
+            self._resize(2 * nbytes)
+        self._received.set()
+
+    def eof_received(self):
+        self._eof = True
+        self._received.set()
+        return False
+
+    def connection_lost(self, exc):
+        self._eof = True
+        self._exc = exc
+        self._received.set()
+        if not self._closed.done():
+            self._closed.set_result(None)
+        if self._drain_waiter is not None and not self._drain_waiter.done():
+            self._drain_waiter.set_result(None)
+
+    def pause_writing(self):
+        self._drain_waiter = asyncio.get_running_loop().create_future()
+
+    def resume_writing(self):
+        if self._drain_waiter is not None and not self._drain_waiter.done():
+            self._drain_waiter.set_result(None)
+        self._drain_waiter = None
+
+    def _resize(self, size):
+        self._buf = bytearray(size)
+        self._view = memoryview(self._buf)
+
+    # Reading
+
+    def _adapt(self):
+        size = self.bytes_received - self._last_message_end
+        self._last_message_end = self.bytes_received
+        self._recent_max = max(self._recent_max, size)
+        self._window += 1
+        if self._window >= self.SHRINK_WINDOW:
+            if 4 * self._recent_max < len(self._buf) and len(self._buf) > self.MIN_BUFFER:
+                self._resize(len(self._buf) // 2)
+            self._recent_max = 0
+            self._window = 0
+
+    async def next_message(self) -> Any:
+        """The next msgpack value received. Raises ConnectionResetError if the peer closed."""
+        while True:
+            try:
+                ret = self.unpack.unpack()
+            except mp.OutOfData:
+                if self._eof:
+                    raise ConnectionResetError("peer closed connection") from self._exc
+                self._received.clear()
+                await self._received.wait()
+                continue
+            self.messages_received += 1
+            self._adapt()
+            return ret
+
+    def stats(self) -> dict:
+        """
+        Statistics of the received data since the connection was opened: the numbers of bytes
+        (as received on the wire), messages and reads, the rates per second, and the current
+        size of the receive buffer.
+        """
+        seconds = max(time.monotonic() - self._started, 1e-9)
+        return {
+            'bytes': self.bytes_received,
+            'messages': self.messages_received,
+            'reads': self.reads,
+            'seconds': seconds,
+            'bytes_per_second': self.bytes_received / seconds,
+            'messages_per_second': self.messages_received / seconds,
+            'buffer_size': len(self._buf),
+        }
+
+    # Writing
+
+    def write(self, data):
+        assert self._transport is not None
+        self._transport.write(data)
+
+    async def drain(self):
+        if self._exc is not None:
+            raise self._exc
+        if self._transport is None or self._transport.is_closing():
+            raise ConnectionResetError("connection closed")
+        if self._drain_waiter is not None:
+            await self._drain_waiter
+
+    def is_closing(self) -> bool:
+        return self._transport is None or self._transport.is_closing()
+
+    def get_extra_info(self, name, default=None):
+        return default if self._transport is None else self._transport.get_extra_info(name, default)
+
+    def close(self):
+        if self._transport is not None:
+            self._transport.close()
+
+    async def wait_closed(self):
+        await self._closed
+
+
+class TrafficRecorder:
+    """
+    Records the traffic of clients into a file, to be replayed by `python -m IsaREPL.replay`
+    against a server. Every client created while recording (see `Client.set_recorder`)
+    is a session of the file.
+
+    The file is a msgpack stream: a header {'isarepl': version, 'time': wall clock seconds},
+    followed by a record for every message received by a client,
+        [session, start, requests, response_bytes, latency, error]
+    where `start` is the time in seconds (since the recorder was created) of the first request
+    sent after the previous message of the session, `requests` are the msgpack values sent
+    since then, `response_bytes` is the size of the message, `latency` is the seconds from
+    `start` to its arrival, and `error` tells whether it reports an error.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._file = open(path, 'wb')
+        self._lock = threading.Lock()
+        self._started = time.monotonic()
+        self._sessions = 0
+        self._file.write(mp.packb({'isarepl': __version__, 'time': time.time()}))
+
+    def new_session(self) -> int:
+        with self._lock:
+            self._sessions += 1
+            return self._sessions
+
+    def record(self, session: int, start: float, requests: list, response_bytes: int,
+               latency: float, error: bool):
+        data = mp.packb([session, round(start - self._started, 6), requests, response_bytes,
+                         round(latency, 6), error])
+        with self._lock:
+            if not self._file.closed:
+                self._file.write(data)
+
+    def flush(self):
+        with self._lock:
+            if not self._file.closed:
+                self._file.flush()
+
+    def close(self):
+        with self._lock:
+            self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+class _MetadataCache:
+    """
+    An LRU cache of the answers of one server to deterministic metadata queries
+    (see `Client.enable_metadata_cache`).
+
+    An entry of a query depending on files records the modification times of these files
+    (None for missing ones), and is invalidated once any of them changes.
+
+    Values are copied in and out, so that callers mutating an answer do not alter the entry.
+    """
+
+    def __init__(self, maxsize: int):
+        self.maxsize = maxsize
+        self.entries: collections.OrderedDict = collections.OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    @staticmethod
+    def _mtimes(paths) -> tuple:
+        mtimes = []
+        for path in paths:
+            try:
+                mtimes.append(os.stat(path).st_mtime_ns)
+            except OSError:
+                mtimes.append(None)
+        return tuple(mtimes)
+
+    def get(self, key, paths=()):
+        """(True, the cached value) or (False, None)"""
+        entry = self.entries.get(key)
+        if entry is not None:
+            value, mtimes = entry
+            if mtimes == self._mtimes(paths):
+                self.entries.move_to_end(key)
+                self.hits += 1
+                return True, copy.deepcopy(value)
+            del self.entries[key]
+            self.invalidations += 1
+        self.misses += 1
+        return False, None
+
+    def put(self, key, value, paths=()):
+        self.entries[key] = (copy.deepcopy(value), self._mtimes(paths))
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.maxsize:
+            self.entries.popitem(last=False)
+
+    def stats(self) -> dict:
+        return {'hits': self.hits, 'misses': self.misses,
+                'invalidations': self.invalidations, 'size': len(self.entries)}
+
+
 class Client:
     """
     A client for connecting Isabelle REPL
@@ -129,10 +521,119 @@ class Client:
 
     clients = {} # from client_id to Client instance
 
-    def __init__(self, addr: str, thy_qualifier: str, timeout: int | None = 3600):
+    recorder: TrafficRecorder | None = None # see `set_recorder`
+
+    @classmethod
+    def set_recorder(cls, recorder: TrafficRecorder | None):
+        """
+        Record the traffic of every client created from now on into `recorder`,
+        or stop recording if None. A single client can also be recorded by setting its
+        `recorder` attribute before connecting. Stopping does not affect the clients
+        already created, which keep recording until they close.
+
+            with TrafficRecorder('session.isarec') as recorder:
+                Client.set_recorder(recorder)
+                ...
+
+        The recording can be replayed by `python -m IsaREPL.replay session.isarec ADDRESS`.
+        """
+        cls.recorder = recorder
+
+    _metadata_cache_size = 0 # 0 when the metadata cache is disabled
+    _metadata_caches: dict[str, _MetadataCache] = {} # from server addresses
+
+    @classmethod
+    def enable_metadata_cache(cls, maxsize: int = 4096):
+        """
+        Cache the answers of `session_name_of`, `path_of_theory`, `parse_thy_header`,
+        `num_processor` and `fast_lex`, which depend only on their arguments and the file
+        system. The cache is shared by all clients of the same server address, and keeps
+        at most `maxsize` answers per server, evicting the least recently used.
+
+        An answer of `session_name_of` is invalidated when the modification time of the
+        file, its directory, or any ROOT or ROOTS file of the ancestor directories changes
+        (including their creation or removal), and one of `path_of_theory` when that of the
+        master directory changes. Answers are returned as copies. This needs the paths to be
+        accessible from the client (e.g., co-located with the server); the answers about
+        inaccessible paths are kept until they are evicted or `clear_metadata_cache` is called.
+        """
+        if not isinstance(maxsize, int) or maxsize <= 0:
+            raise ValueError("the argument maxsize must be a positive integer")
+        cls._metadata_cache_size = maxsize
+        for cache in cls._metadata_caches.values():
+            cache.maxsize = maxsize
+
+    @classmethod
+    def disable_metadata_cache(cls):
+        """Stop caching metadata queries, and drop the cached answers"""
+        cls._metadata_cache_size = 0
+        cls._metadata_caches.clear()
+
+    @classmethod
+    def clear_metadata_cache(cls, addr: str | None = None):
+        """Drop the cached answers of the server at `addr`, or of all servers if None"""
+        if addr is None:
+            cls._metadata_caches.clear()
+        else:
+            cls._metadata_caches.pop(addr, None)
+
+    @classmethod
+    def metadata_cache_stats(cls, addr: str | None = None) -> dict:
+        """
+        The numbers of hits, misses, invalidations (included in misses) and cached answers
+        of the metadata cache of the server at `addr`, or summed over all servers if None.
+        """
+        caches = cls._metadata_caches.values() if addr is None \
+                 else [c for c in [cls._metadata_caches.get(addr)] if c is not None]
+        total = {'hits': 0, 'misses': 0, 'invalidations': 0, 'size': 0}
+        for cache in caches:
+            for k, v in cache.stats().items():
+                total[k] += v
+        return total
+
+    def _metadata_cache(self) -> _MetadataCache | None:
+        if not Client._metadata_cache_size:
+            return None
+        cache = Client._metadata_caches.get(self.addr)
+        if cache is None:
+            cache = _MetadataCache(Client._metadata_cache_size)
+            Client._metadata_caches[self.addr] = cache
+        return cache
+
+    async def _cached(self, key, compute, paths=()):
+        """The answer to the query `key`, from the metadata cache if enabled"""
+        cache = self._metadata_cache()
+        if cache is None:
+            return await compute()
+        found, value = cache.get(key, paths)
+        if found:
+            return value
+        value = await compute()
+        cache.put(key, value, paths)
+        return value
+
+    def __init__(self, addr: str, thy_qualifier: str, timeout: int | None = 3600,
+                 compression: int | None = None, cancel_on_timeout: bool = False):
         """
         Initialize client attributes only. Use `Client.create()` to construct
         a connected client instance.
+
+        compression: if given, the server compresses (as raw DEFLATE) every response of at least
+            this number of bytes, which pays off on slow networks for large responses like
+            whole-theory traces. The requests are not compressed. Responses are compressed in
+            chunks of at most 64 KiB, and the threshold applies to every chunk: the tail chunk
+            of a long response is sent uncompressed if shorter than the threshold, and
+            thresholds above 65536 are not meaningful.
+
+        timeout: the seconds to wait for the response of every request, or None to wait forever.
+            When it expires, `asyncio.TimeoutError` is raised and the late response is skipped,
+            but the server keeps evaluating the request (so the next request waits for it),
+            unless `cancel_on_timeout` is set.
+
+        cancel_on_timeout: whether the server is requested to cancel the evaluation when
+            `timeout` expires. An explicit deadline (the argument `deadline` of requests, or the
+            context `deadline`) and the cancellation of the awaiting task always cancel the
+            evaluation. In all these cases the client remains usable.
         """
         if not isinstance(thy_qualifier, str):
             raise ValueError("the argument thy_qualifier must be a string")
@@ -140,72 +641,178 @@ class Client:
         self.addr = addr
         self.thy_qualifier = thy_qualifier
         self.timeout = timeout
-        self.reader: asyncio.StreamReader | None = None
-        self.writer: asyncio.StreamWriter | None = None
-        self.unpack = mp.Unpacker(unicode_errors='replace')
+        self.conn: _Transport | None = None
         self.pid: int | None = None
         self.client_id: int | None = None
+        self._deadline: float | None = None
+        self._stale = 0 # number of responses of cancelled requests to be skipped
+        self._timing = False
+        if compression is not None and not isinstance(compression, int):
+            raise ValueError("the argument compression must be an integer")
+        self.compression = compression
+        self.cancel_on_timeout = cancel_on_timeout
+        self.last_timing: dict | None = None # see `set_timing`
+        # pinned, so that the session keeps recording even if the class stops
+        self.recorder: TrafficRecorder | None = Client.recorder
+        self._rec_session = 0 # the session in `self.recorder`, if recording
+        self._rec_requests: list = [] # values sent since the last received message
+        self._rec_start: float | None = None
+        self._rec_offset = 0 # the position of the unpacker at the last received message
 
     @staticmethod
     def _parse_address(address):
         host, port = address.split(':')
         return (host, int(port))
 
-    async def _feed_and_unpack(self) -> Any:
-        """Read bytes from StreamReader, feed to Unpacker, return next msgpack object."""
-        assert self.reader is not None, "Client not connected — use 'async with' or call __aenter__ first"
+    @staticmethod
+    async def _open_connection(address) -> _Transport:
+        return await _Transport.open(address)
+
+    @staticmethod
+    async def _request_once(address, request) -> Any:
+        """Send `request` through a short connection and return the response"""
+        conn = await Client._open_connection(address)
+        try:
+            conn.write(mp.packb(request))  # type: ignore[arg-type]
+            await conn.drain()
+            return await conn.next_message()
+        finally:
+            conn.close()
+            await conn.wait_closed()
+
+    def transfer_stats(self) -> dict | None:
+        """
+        Statistics of the data received from the server by this client, see `_Transport.stats`.
+        None if not connected.
+        """
+        return None if self.conn is None else self.conn.stats()
+
+    async def _unpack_response(self) -> Any:
+        assert self.conn is not None, "Client not connected — use 'async with' or call __aenter__ first"
         while True:
-            try:
-                return self.unpack.unpack()
-            except mp.OutOfData:
-                data = await self.reader.read(65536)
-                if not data:
-                    raise ConnectionResetError("peer closed connection")
-                self.unpack.feed(data)
+            ret = await self.conn.next_message()
+            if self._rec_session:
+                self._record(ret)
+            if self._stale:
+                self._stale -= 1
+                continue
+            if self._timing and isinstance(ret, list) and len(ret) == 3:
+                self.last_timing = Client._parse_timing(ret[2])
+                ret = ret[:2]
+            return ret
+
+    def _record_request(self, *values):
+        if self._rec_start is None:
+            self._rec_start = time.monotonic()
+        self._rec_requests.extend(values)
+
+    def _record(self, response):
+        assert self.recorder is not None and self.conn is not None
+        now = time.monotonic()
+        start = self._rec_start if self._rec_start is not None else now
+        offset = self.conn.unpack.tell()
+        error = isinstance(response, (list, tuple)) and len(response) >= 2 and response[1] is not None
+        self.recorder.record(self._rec_session, start, self._rec_requests, offset - self._rec_offset,
+                             now - start, error)
+        self._rec_offset = offset
+        self._rec_requests = []
+        self._rec_start = None
+
+    @staticmethod
+    def _parse_timing(timing):
+        return {phase: tuple(us / 1e6 for us in t) for phase, t in timing.items()}
+
+    async def _feed_and_unpack(self, deadline: float | None = None) -> Any:
+        """
+        Read bytes from StreamReader, feed to Unpacker, return next msgpack object.
+        The pending request is cancelled on the server if the response does not arrive
+        within `deadline` seconds (defaulting to the current `deadline`), or if the awaiting
+        task is cancelled. Without deadline, the response is awaited for `self.timeout` seconds,
+        and the request is only cancelled if `self.cancel_on_timeout`.
+        """
+        if deadline is None:
+            deadline = self._deadline
+        cancel = deadline is not None or self.cancel_on_timeout
+        if deadline is None:
+            deadline = self.timeout
+        try:
+            return await asyncio.wait_for(self._unpack_response(), deadline)
+        except asyncio.TimeoutError:
+            self._cancel_request(cancel)
+            raise
+        except asyncio.CancelledError:
+            self._cancel_request()
+            raise
+
+    def _cancel_request(self, interrupt: bool = True):
+        """
+        Skip the response of the pending request, and if `interrupt`, request the server
+        to interrupt its evaluation. The request still responds (typically an interruption
+        error), which is skipped.
+        """
+        if self.conn is None or self.conn.is_closing():
+            return
+        if interrupt:
+            self.conn.write(mp.packb("\x05cancel"))  # type: ignore[arg-type]
+            if self._rec_session:
+                self._record_request("\x05cancel")
+        self._stale += 1
+
+    @contextlib.contextmanager
+    def deadline(self, seconds: float | None):
+        """
+        Within the context, every request waits for its response for at most `seconds`,
+        instead of `self.timeout`, and is cancelled on the server when they expire.
+        None keeps the current deadline.
+
+        Usage:
+            with client.deadline(30):
+                await client.eval(...)
+        """
+        old = self._deadline
+        if seconds is not None:
+            self._deadline = seconds
+        try:
+            yield self
+        finally:
+            self._deadline = old
 
     async def _write(self, *args):
         """Pack and send one or more msgpack values, then drain."""
-        if self.writer is None or self.writer.is_closing():
+        if self.conn is None or self.conn.is_closing():
             raise REPLFail(f"Client {self.client_id} is dead or closed")
         for a in args:
-            self.writer.write(mp.packb(a))  # type: ignore[arg-type]
-        await self.writer.drain()
+            self.conn.write(mp.packb(a))  # type: ignore[arg-type]
+        if self._rec_session:
+            self._record_request(*args)
+        await self.conn.drain()
 
 
     async def _read(self):
         return Client._parse_control_(await self._feed_and_unpack())
 
     def _chk_live(self):
-        if self.writer is None or self.writer.is_closing():
+        if self.conn is None or self.conn.is_closing():
             raise REPLFail(f"Client {self.client_id} is dead or closed")
 
     @classmethod
     async def test_server(cls, addr, timeout=60):
-        host, port = addr.split(':')
-        reader, writer = await asyncio.open_connection(host, port)
-        try:
-            unpack = mp.Unpacker(unicode_errors='replace')
-            writer.write(mp.packb("heartbeat"))  # type: ignore[arg-type]
-            await writer.drain()
-            while True:
-                try:
-                    result = unpack.unpack()
-                    break
-                except mp.OutOfData:
-                    data = await reader.read(65536)
-                    if not data:
-                        raise ConnectionResetError("peer closed connection")
-                    unpack.feed(data)
-            Client._parse_control_(result)
-        finally:
-            writer.close()
-            await writer.wait_closed()
+        """
+        Raise an exception if the server at `addr` does not answer a heartbeat,
+        e.g., `asyncio.TimeoutError` if it does not answer within `timeout` seconds.
+        """
+        Client._parse_control_(await asyncio.wait_for(Client._request_once(addr, "heartbeat"), timeout))
 
 
     async def __aenter__(self):
-        host, port = self._parse_address(self.addr)
-        self.reader, self.writer = await asyncio.open_connection(host, port)
-        await self._write(__version__, self.thy_qualifier)
+        self.conn = await _Transport.open(self.addr, ext_hook=_ext_hook)
+        if self.recorder is not None:
+            self._rec_session = self.recorder.new_session()
+        if self.compression is None:
+            await self._write(__version__, self.thy_qualifier)
+        else:
+            self.conn.inflate = zlib.decompressobj(-zlib.MAX_WBITS)
+            await self._write(f"{__version__};zlib:{self.compression}", self.thy_qualifier)
         (self.pid, self.client_id) = Client._parse_control_(await self._feed_and_unpack())
         Client.clients[self.client_id] = self
         return self
@@ -214,31 +821,14 @@ class Client:
 
     @classmethod
     async def kill_client(cls, addr, client_id, timeout=60) -> bool:
-        host, port = addr.split(':')
-        reader, writer = await asyncio.open_connection(host, port)
-        try:
-            unpack = mp.Unpacker(unicode_errors='replace')
-            writer.write(mp.packb("kill " + str(client_id)))  # type: ignore[arg-type]
-            await writer.drain()
-            while True:
-                try:
-                    result = unpack.unpack()
-                    break
-                except mp.OutOfData:
-                    data = await reader.read(65536)
-                    if not data:
-                        raise ConnectionResetError("peer closed connection")
-                    unpack.feed(data)
-            return Client._parse_control_(result)
-        finally:
-            writer.close()
-            await writer.wait_closed()
+        return Client._parse_control_(
+            await asyncio.wait_for(Client._request_once(addr, "kill " + str(client_id)), timeout))
 
 
     def close(self):
-        if self.writer is not None:
+        if self.conn is not None:
             try:
-                self.writer.close()
+                self.conn.close()
             except:
                 pass
         try:
@@ -253,7 +843,8 @@ class Client:
         else:
             raise REPLFail(ret[1])
 
-    async def eval(self, source, timeout=None, cmd_timeout=None, import_dir=None, base_dir=None, configs=None):
+    async def eval(self, source, timeout=None, cmd_timeout=None, import_dir=None, base_dir=None, configs=None,
+                   deadline=None):
         """
         The `eval` method ONLY accepts **complete** commands ---
         It is strictly forbiddened to split a command into multiple fragments and
@@ -280,6 +871,9 @@ class Client:
 
         timeout: the milliseconds to wait for the evaluation to finish.
         cmd_timeout: the milliseconds to wait for every single command other than sledgehammer and auto_sledgehammer.
+        deadline: the seconds to wait for the response on the client side, after which the
+            evaluation is cancelled on the server and `asyncio.TimeoutError` is raised.
+            Defaults to the context `deadline`, or `self.timeout` (see `Client.__init__`).
         """
         self._chk_live()
         if not isinstance(source, str):
@@ -304,7 +898,7 @@ class Client:
             await self._write(source)
         else:
             await self._write("\x05eval", (source, timeout, cmd_timeout, import_dir, base_dir, configs))
-        ret = Client._parse_control_(await self._feed_and_unpack())
+        ret = Client._parse_control_(await self._feed_and_unpack(deadline))
         if ret is None:
             return None
         else:
@@ -323,6 +917,55 @@ class Client:
         await self._write("\x05trace" if trace else "\x05notrace")
         Client._parse_control_(await self._feed_and_unpack())
 
+    async def set_print_state(self, enabled : bool):
+        """
+        Enables (by default) or disables printing the proof state of every command into
+        `CommandOutput.state`, which is then an empty string. Printing large goals is costly;
+        clients comparing states can use `set_fingerprint` instead.
+        """
+        self._chk_live()
+        if not isinstance(enabled, bool):
+            raise ValueError("the argument enabled must be a boolean")
+        await self._write("\x05print_state", enabled)
+        Client._parse_control_(await self._feed_and_unpack())
+
+    async def set_fingerprint(self, enabled : bool):
+        """
+        Enables or disables (by default) the `fingerprint` and `goal_count` of every `CommandOutput`.
+        A fingerprint is a structural hash computed on the server without printing the state,
+        suited to deduplicate states during proof search.
+        """
+        self._chk_live()
+        if not isinstance(enabled, bool):
+            raise ValueError("the argument enabled must be a boolean")
+        await self._write("\x05fingerprint", enabled)
+        Client._parse_control_(await self._feed_and_unpack())
+
+    async def set_timing(self, enabled : bool):
+        """
+        Enables or disables the server-side timing of every later request.
+
+        When enabled, `self.last_timing` is set by every response to a dictionary from phases to
+        (elapsed, cpu, gc) seconds spent on the request. The phases are
+            'thy_loader' : loading the imported theories
+            'parse'      : parsing the source
+            'exec'       : executing the commands
+            'plugins'    : running the plugins
+            'printing'   : printing the outputs and the proof states
+            'packing'    : serializing the response
+            'total'      : the whole request, including the time not in any phase above
+        Each phase excludes the phases nested in it. Besides, every `CommandOutput` returned by
+        `eval` carries the timing of its own command in its `timing` attribute.
+        """
+        self._chk_live()
+        if not isinstance(enabled, bool):
+            raise ValueError("the argument enabled must be a boolean")
+        await self._write("\x05timing", enabled)
+        Client._parse_control_(await self._feed_and_unpack())
+        self._timing = enabled
+        if not enabled:
+            self.last_timing = None
+
     async def set_register_thy(self, value):
         self._chk_live()
         if not isinstance(value, bool):
@@ -330,6 +973,41 @@ class Client:
         await self._write("\x05register_thy" if value else "\x05no_register_thy")
         Client._parse_control_(await self._feed_and_unpack())
 
+    async def set_thy_writes(self, mode : str):
+        """
+        How the sources of registered theories are written into their .thy files under the base
+        directory (see `set_register_thy`).
+            'sync'     : appended at every evaluation (the default)
+            'buffered' : appended by a background thread on the server, at the end of the theory,
+                         periodically, and before any theory is loaded
+            'memory'   : never written, but kept in memory (see `theory_source`)
+        """
+        self._chk_live()
+        if mode not in ('sync', 'buffered', 'memory'):
+            raise ValueError("the argument mode must be 'sync', 'buffered' or 'memory'")
+        await self._write("\x05thy_writes", mode)
+        Client._parse_control_(await self._feed_and_unpack())
+
+    async def flush_thy(self):
+        """
+        Writes all buffered theory sources (see `set_thy_writes`) before returning.
+        """
+        self._chk_live()
+        await self._write("\x05flush_thy")
+        Client._parse_control_(await self._feed_and_unpack())
+
+    async def theory_source(self, path : str) -> str | None:
+        """
+        The source of the .thy file at `path` (relative to the base directory of the client),
+        including the sources buffered or kept in memory (see `set_thy_writes`).
+        None if there is no such file.
+        """
+        self._chk_live()
+        if not isinstance(path, str):
+            raise ValueError("the argument path must be a string")
+        await self._write("\x05thy_source", path)
+        return Client._parse_control_(await self._feed_and_unpack())
+
     async def lex(self, source):
         """
         This method splits the given `source` into a sequence of code pieces.
@@ -368,9 +1046,11 @@ class Client:
         self._chk_live()
         if not isinstance(source, str):
             raise ValueError("the argument source must be a string")
-        await self._write("\x05lex'", source)
-        ret = await self._read()
-        ret = [(Position.unpack(pos), src) for pos, src in ret]
+        async def compute():
+            await self._write("\x05lex'", source)
+            ret = await self._read()
+            return [(Position.unpack(pos), src) for pos, src in ret]
+        ret = await self._cached(('fast_lex', source), compute)
         #__repair_positions__(ret)
         return ret
 
@@ -418,6 +1098,15 @@ class Client:
 
         `new_state` allows you to alter the evaluation state. Set `new_state` to NONE if you
         do not want to change the state.
+
+        A plugin emitting large data that is already encoded (e.g., packed tensors or raw term
+        encodings) can wrap it by `REPL_Serialize.pack_blob` (for a `Word8Vector.vector`),
+        `REPL_Serialize.pack_string_blob`, or `REPL_Serialize.pack_as_blob` (for any raw packer).
+        Such blobs are not decoded by this client but exposed as `memoryview`s.
+        See also `set_plugin_sink`.
+
+        The server compiles each (thy, ML) pair only once and reuses the compiled plugin for
+        any later session installing the same source. See also `register_plugin`.
         """
         self._chk_live()
         if not isinstance(thy, str):
@@ -429,6 +1118,72 @@ class Client:
         await self._write("\x05plugin", thy, name, ML)
         return Client._parse_control_(await self._feed_and_unpack())
 
+    async def set_plugin_sink(self, path: str | None) -> str | None:
+        """
+        Redirect the outputs of all plugins in this session into a file on the server,
+        instead of sending them through the socket.
+        The file is truncated when this method is called. Later, in every `CommandOutput`,
+        `plugin_output` maps each plugin to a `PluginSinkRef` pointing to the msgpack
+        encoding of its output in the file, which can be read by `PluginSinkRef.read`
+        or `PluginSinkRef.unpack` if the file is accessible from the client.
+        The `fingerprint`, `goal_count` and `timing` of command outputs are still sent through
+        the socket.
+
+        A relative `path` is resolved on the server side.
+        Pass None to send plugin outputs through the socket again.
+        Returns the absolute path of the sink file on the server, or None.
+        """
+        self._chk_live()
+        if path is not None and not isinstance(path, str):
+            raise ValueError("the argument path must be a string or None")
+        await self._write("\x05plugin_sink", path)
+        return Client._parse_control_(await self._feed_and_unpack())
+
+    async def register_plugin(self, name, ML, thy='Isa_REPL.Isa_REPL') -> tuple[int, bool]:
+        """
+        Compile a plugin once for the whole server and publish it under `name`, so that
+        any session (of any client) can install it by `attach_plugin(name)` without
+        shipping or compiling the ML source again.
+        Re-registering a name replaces the previous plugin of that name.
+        The arguments have the same meaning as in the `plugin` method.
+
+        Returns a tuple `(compile_time, cached)`, where `compile_time` is the milliseconds
+        spent on compiling the plugin, and `cached` indicates whether an already compiled
+        plugin of the same (thy, ML) was reused.
+        Registration does not install the plugin into the current session.
+        """
+        self._chk_live()
+        if not isinstance(thy, str):
+            raise ValueError("the argument thy must be a string")
+        if not isinstance(name, str):
+            raise ValueError("the argument name must be a string")
+        if not isinstance(ML, str):
+            raise ValueError("the argument ML must be a string")
+        await self._write("\x05register_plugin", thy, name, ML)
+        compile_time, cached = Client._parse_control_(await self._feed_and_unpack())
+        return (compile_time, cached)
+
+    async def attach_plugin(self, name):
+        """
+        Install a plugin registered by `register_plugin` into the current session.
+        Raises REPLFail if no plugin named `name` is registered on the server.
+        The plugin can be removed by `unplugin` as usual.
+        """
+        self._chk_live()
+        if not isinstance(name, str):
+            raise ValueError("the argument name must be a string")
+        await self._write("\x05attach_plugin", name)
+        Client._parse_control_(await self._feed_and_unpack())
+
+    async def shared_plugins(self) -> dict[str, tuple[str, int]]:
+        """
+        Returns a dictionary from the names of the plugins registered by `register_plugin`
+        to `(thy, compile_time)`.
+        """
+        self._chk_live()
+        await self._write("\x05shared_plugins")
+        return {k: tuple(v) for k, v in Client._parse_control_(await self._feed_and_unpack())}
+
     async def unplugin(self, name):
         """
         Remove an installed plugin.
@@ -487,7 +1242,7 @@ class Client:
         return {k: CommandOutput.parse(v) for k, v in ret.items()}
 
 
-    async def hammer (self, timeout):
+    async def hammer (self, timeout, deadline=None):
         """
         Invoke Isabelle Sledgehammer within an indicated timeout (in seconds, and 0 means no timeout).
         Returns obtained tactic scripts if succeeds; or raises REPLFail on failure.
@@ -509,12 +1264,14 @@ class Client:
         This pre-play time limit is configurable by evaluating
         `delcare [[REPL_sledgehammer_preplay_timeout = <ANY SECONDS>]]`
         e.g, `delcare [[REPL_sledgehammer_preplay_timeout = 6]]`
+
+        deadline: the seconds to wait for the response on the client side, see `eval`.
         """
         self._chk_live()
         if not isinstance(timeout, int):
             raise ValueError("the argument name must be an integer")
         await self._write("\x05hammer", timeout)
-        return Client._parse_control_(await self._feed_and_unpack())
+        return Client._parse_control_(await self._feed_and_unpack(deadline))
 
     async def context(self, pp='pretty'):
         """
@@ -541,6 +1298,58 @@ class Client:
         await self._write("\x05context", pp)
         return Client._parse_control_(await self._feed_and_unpack())
 
+    async def context_diff(self, since : str, pp='pretty'):
+        """
+        The difference of the current context (see `context`) from the context of the
+        historical state `since` (see `record_state`), which is much smaller than the full
+        context when the two states are close. A state outside proofs is taken as an empty context.
+
+        @return:
+        A tuple of (
+            local_facts: (dict[str, [thm]], [str]),
+            assumptions: [thm | int],
+            binding: (dict[str, (typ, term)], [str]),
+            (fixed term variabls, fixed type variables): ((dict[str, typ], [str]), (dict[str, sort], [str])),
+            goals: [term | int]
+        )
+        where each pair of a dictionary and a list gives the new or changed entries and the names of
+        the removed entries, and in each list an integer refers to the element at that index in the
+        old context. `Client.apply_context_diff` applies the difference to the old context.
+
+        The server remembers the fragments it printed for the current proof context, so repeated
+        differences of the same state (e.g., against several historical states) do not print
+        them again. The fragments are forgotten once the proof context changes, as their printing
+        depends on it.
+        """
+        self._chk_live()
+        if not isinstance(since, str):
+            raise ValueError("the argument since must be a string")
+        if not isinstance(pp, str):
+            raise ValueError("the argument pp must be a string")
+        await self._write("\x05context_diff", (pp, since))
+        return Client._parse_control_(await self._feed_and_unpack())
+
+    @staticmethod
+    def apply_context_diff(old, diff):
+        """
+        Applies the result of `context_diff` to the result of `context` at the old state,
+        returning the new context in the format of `context`.
+        """
+        def table(old, diff):
+            updated, removed = diff
+            ret = {k: v for k, v in old.items() if k not in removed}
+            ret.update(updated)
+            return ret
+        def items(old, diff):
+            return [old[x] if isinstance(x, int) else x for x in diff]
+        return [
+            table(old[0], diff[0]),
+            items(old[1], diff[1]),
+            table(old[2], diff[2]),
+            [table(old[3][0], diff[3][0]), table(old[3][1], diff[3][1])],
+            items(old[4], diff[4])
+        ]
+
     @staticmethod
     def parse_ctxt(raw):
         return {
@@ -615,8 +1424,19 @@ class Client:
         self._chk_live()
         if not isinstance(path, str):
             raise ValueError("the argument `path` must be a string")
-        await self._write("\x05session-of", path)
-        return Client._parse_control_(await self._feed_and_unpack())
+        async def compute():
+            await self._write("\x05session-of", path)
+            return Client._parse_control_(await self._feed_and_unpack())
+        # the session is resolved against the ROOT and ROOTS files of the ancestor directories
+        paths = [path]
+        directory = os.path.dirname(os.path.abspath(path))
+        while True:
+            paths += (directory, os.path.join(directory, 'ROOT'), os.path.join(directory, 'ROOTS'))
+            parent = os.path.dirname(directory)
+            if parent == directory:
+                break
+            directory = parent
+        return await self._cached(('session_name_of', path), compute, paths)
 
     async def run_app(self, name):
         """
@@ -665,7 +1485,9 @@ class Client:
 
     async def file(self, path : str, line : int = ~1, column : int = 0,
              timeout : int | None = None, attrs : list[str] = [],
-             cache_position : bool = False, use_cache : bool = False):
+             cache_position : bool = False, use_cache : bool = False,
+             deadline : float | None = None, proofs : str = 'check',
+             checkpoint_every : int | None = None, checkpoint_theorems : bool = False):
         """
         Evaluate the file at the given path.
         This method only returns erros encountered during the evaluation.
@@ -677,6 +1499,24 @@ class Client:
         will stop at the position `line:column`.
 
         Timeout: the milliseconds to wait for the evaluation to finish.
+        Deadline: the seconds to wait for the response on the client side, see `eval`.
+
+        Proofs: how the complete proofs of theory-level statements (e.g., `lemma`) are evaluated.
+            'check' - the proofs are checked, as usual;
+            'skip'  - the proofs are replaced by `sorry`, so only the statements are elaborated;
+            'fork'  - the proofs are replaced by `sorry` and checked in parallel with the rest
+                      of the evaluation. The call returns once they are checked, and they are
+                      cancelled if the evaluation fails or is cancelled. Failed proofs are
+                      reported asynchronously as errors of this client, see `install_watcher`
+                      and `subscribe`.
+            The proof around the target position is always evaluated, as are proofs of
+            `schematic_goal` and statements abandoned by `oops`. Skipping requires `quick_and_dirty`, which `repl_server.sh` enables.
+            States cached with proofs skipped are only reused by calls that skip proofs.
+
+        Checkpoint_every, checkpoint_theorems: cache the states every `checkpoint_every` commands
+            and at the end of every top-level proof during the evaluation, so that later calls with
+            `use_cache` resume from the nearest checkpoint before their positions.
+            The checkpoints are recorded only if the evaluation succeeds.
         """
         self._chk_live()
         if not isinstance(path, str):
@@ -693,11 +1533,26 @@ class Client:
             raise ValueError("the argument `use_cache` must be a bool")
         if not isinstance(attrs, list):
             raise ValueError("the argument `attrs` must be a list")
+        if proofs not in ('check', 'skip', 'fork'):
+            raise ValueError("the argument `proofs` must be one of 'check', 'skip', and 'fork'")
+        if checkpoint_every is not None and (not isinstance(checkpoint_every, int) or checkpoint_every <= 0):
+            raise ValueError("the argument `checkpoint_every` must be a positive int or None")
         pos = None
         if line >= 0:
             pos = (line, column)
-        await self._write("\x05file", (path, pos, timeout, cache_position, use_cache, attrs))
-        errs = Client._parse_control_(await self._feed_and_unpack())
+        options = {}
+        if proofs != 'check':
+            options['proofs'] = proofs
+        if checkpoint_every is not None:
+            options['checkpoint_every'] = str(checkpoint_every)
+        if checkpoint_theorems:
+            options['checkpoint_theorems'] = 'true'
+        if not options:
+            await self._write("\x05file", (path, pos, timeout, cache_position, use_cache, attrs))
+        else:
+            await self._write("\x05file_ext", ((path, pos, timeout, cache_position, use_cache, attrs),
+                                                options))
+        errs = Client._parse_control_(await self._feed_and_unpack(deadline))
         if errs:
             raise REPLFail('\n'.join(errs))
         return None
@@ -729,12 +1584,34 @@ class Client:
         :return: the number of processors available
         """
         self._chk_live()
-        await self._write("\x05numcpu")
-        ret = Client._parse_control_(await self._feed_and_unpack())
+        async def compute():
+            await self._write("\x05numcpu")
+            return Client._parse_control_(await self._feed_and_unpack())
+        ret = await self._cached(('num_processor',), compute)
         if ret <= 0:
             ret = 1
         return ret
 
+    async def metrics(self) -> str:
+        """
+        Returns the operational metrics of the server in the text exposition format of
+        Prometheus, including per-command request counts and latency histograms, the number
+        of active clients, the waiting time of the theory loader lock, the size and hit rate
+        of the evaluation cache of `file`, the sizes of recorded histories, the heap size and
+        its free space after the last (full) garbage collection, the numbers of full garbage
+        collections and of ML threads, and the fraction of time spent on garbage collection.
+        """
+        self._chk_live()
+        await self._write("\x05metrics")
+        return Client._parse_control_(await self._feed_and_unpack())
+
+    @classmethod
+    async def scrape_metrics(cls, addr) -> str:
+        """
+        Same as `metrics` but through a short connection that does not start a client session.
+        """
+        return Client._parse_control_(await Client._request_once(addr, "metrics"))
+
     async def set_cmd_timeout(self, timeout):
         """
         Set the timeout for commands other than sledgehammer and auto_sledgehammer.
@@ -758,8 +1635,11 @@ class Client:
             raise ValueError("the argument `theory_name` must be a string")
         if not isinstance(master_directory, str):
             raise ValueError("the argument `master_directory` must be a string")
-        await self._write("\x05path", (master_directory, theory_name))
-        return Client._parse_control_(await self._feed_and_unpack())
+        async def compute():
+            await self._write("\x05path", (master_directory, theory_name))
+            return Client._parse_control_(await self._feed_and_unpack())
+        return await self._cached(('path_of_theory', theory_name, master_directory), compute,
+                                  (master_directory,))
 
     async def parse_thy_header(self, header_src):
         """
@@ -770,16 +1650,18 @@ class Client:
         self._chk_live()
         if not isinstance(header_src, str):
             raise ValueError("the argument `header_src` must be a string")
-        lines = await self.fast_lex(header_src)
-        theory_line = None
-        for _, line in lines:
-            if line.strip().startswith('theory'):
-                theory_line = line.strip()
-                break
-        if not theory_line:
-            raise ValueError("no `theory` declaration found in the given `header_src`")
-        await self._write("\x05thy_header", theory_line)
-        return Client._parse_control_(await self._feed_and_unpack())
+        async def compute():
+            lines = await self.fast_lex(header_src)
+            theory_line = None
+            for _, line in lines:
+                if line.strip().startswith('theory'):
+                    theory_line = line.strip()
+                    break
+            if not theory_line:
+                raise ValueError("no `theory` declaration found in the given `header_src`")
+            await self._write("\x05thy_header", theory_line)
+            return Client._parse_control_(await self._feed_and_unpack())
+        return await self._cached(('parse_thy_header', header_src), compute)
 
     async def translate_position(self, src : str) -> Callable[[int | IsabellePosition], int | Position]:
         if not isinstance(src, str):
@@ -837,7 +1719,8 @@ class Client:
         return translate
 
 
-    async def premise_selection(self, mode, number : int, methods : list[str], params : dict[str, str] = {}, printer : str='pretty'):
+    async def premise_selection(self, mode, number : int, methods : list[str], params : dict[str, str] = {}, printer : str='pretty',
+                                deadline : float | None = None):
         """
         Conduct the premise selection provided by Sledgehammer.
         @param number: the number of relevant premises to return
@@ -850,6 +1733,7 @@ class Client:
             'final' : select the lemmas relevant to the final goal(s).
                       Multiple final goals are connected by '&&' to be considered as a single goal.
             'each'  : select the lemmas relevant to each goal.
+        @param deadline: the seconds to wait for the response on the client side, see `eval`.
         @return:
             for mode = 'leading' or 'final':
                 return a dictionary from the name of the retrived lemmas to their expressions.
@@ -868,7 +1752,7 @@ class Client:
         if not isinstance(mode, str):
             raise ValueError("the argument `mode` must be a string")
         await self._write("\x05premise_selection", (number, methods, params, printer, mode))
-        return Client._parse_control_(await self._feed_and_unpack())
+        return Client._parse_control_(await self._feed_and_unpack(deadline))
 
     async def _health_of_clients(self):
         """
@@ -916,9 +1800,45 @@ class Client:
             raise REPLFail(ret[1])
         return ret[0]
 
+    @classmethod
+    async def subscribe(cls, addr):
+        """
+        Subscribe to the client lifecycle events of the server at `addr`.
+        This is an async iterator of `HealthEvent`s, pushed by the server as they happen
+        over a single long-lived connection:
+
+            async for event in Client.subscribe(addr):
+                ...
+
+        The iteration starts with an 'alive' event for every client alive at the time of
+        subscription, and terminates when the server closes the connection.
+        Unlike the `diagnosis` polling used by `install_watcher`, errors are not drained from
+        the clients' error buffers, so every subscriber receives every event.
+        """
+        conn = await Client._open_connection(addr)
+        try:
+            conn.write(mp.packb("subscribe"))  # type: ignore[arg-type]
+            await conn.drain()
+            acked = False
+            while True:
+                try:
+                    msg = await conn.next_message()
+                except ConnectionResetError:
+                    if not acked:
+                        raise
+                    return
+                ret = Client._parse_control_(msg)
+                if not acked:
+                    acked = True
+                    continue
+                yield HealthEvent(*ret)
+        finally:
+            conn.close()
+
     _watchers = {}
     @classmethod
-    async def install_watcher(cls, addr, handler, interval : int = 2, allow_multiple_watchers : bool = False, replace_existing : bool = True, verbose = False):
+    async def install_watcher(cls, addr, handler, interval : int = 2, allow_multiple_watchers : bool = False, replace_existing : bool = True, verbose = False,
+                              push : bool = False):
         """
         Install a watcher to monitor the health of each client regularly.
 
@@ -927,7 +1847,28 @@ class Client:
         interval: the interval in seconds to check the health of each client, default to 2 seconds.
         allow_multiple_watchers: By default, only one watcher is allowed. But you can allow multiple watchers
             by truning on this flag. Note, each error message can only be dispatched to one watcher of the multiple watchers randomly.
-        """
+        push: Instead of polling the server every `interval` seconds, receive the events pushed by the server
+            (see `subscribe`), so failures are reported as soon as they happen.
+            In this mode, every watcher receives every error message, and `interval` is ignored.
+        """
+        async def _push_loop(cancel_event: asyncio.Event):
+            async def _consume():
+                async for event in cls.subscribe(addr):
+                    if event.kind == 'error':
+                        handler(event.client_id, (True, [event.detail]))
+                    elif event.kind in ('disconnected', 'died', 'killed'):
+                        handler(event.client_id, (False, [event.detail] if event.detail else []))
+                        cc = cls.clients.get(event.client_id)
+                        if cc is not None:
+                            cc.close()
+                    elif verbose and event.client_id >= 0:
+                        handler(event.client_id, (True, []))
+            consumer = asyncio.create_task(_consume())
+            canceller = asyncio.create_task(cancel_event.wait())
+            await asyncio.wait({consumer, canceller}, return_when=asyncio.FIRST_COMPLETED)
+            consumer.cancel()
+            canceller.cancel()
+
         async def _watcher_loop(cancel_event: asyncio.Event):
             async with Client(addr, 'HOL') as client:
                 while not cancel_event.is_set():
@@ -963,5 +1904,140 @@ class Client:
         if watchers and not allow_multiple_watchers:
             raise ValueError("Only one watcher is allowed")
         cancel_event = asyncio.Event()
-        task = asyncio.create_task(_watcher_loop(cancel_event))
+        task = asyncio.create_task((_push_loop if push else _watcher_loop)(cancel_event))
         watchers.append((task, cancel_event))
+
+
+class SyncClient:
+    """
+    A synchronous facade of `Client`, which can be shared among threads.
+
+    All `SyncClient`s run their `Client`s on a single background event loop thread,
+    started on first use. Every async method of `Client` is exposed as a blocking method
+    of the same name. Calls to the same session from concurrent threads are queued and
+    served in order, while different sessions proceed in parallel.
+
+        c = SyncClient(addr, 'HOL')
+        ret = c.eval(src)
+        c.close()
+
+    Callbacks given to the client (e.g., the handler of `install_watcher`) run on the
+    event loop thread, and must not call `SyncClient`s, which would deadlock.
+    """
+
+    _loop: asyncio.AbstractEventLoop | None = None
+    _loop_lock = threading.Lock()
+
+    def __init__(self, addr: str, thy_qualifier: str, timeout: int | None = 3600,
+                 compression: int | None = None, cancel_on_timeout: bool = False):
+        """
+        Connect to the server at `addr`. The arguments are those of `Client`.
+        """
+        self.client = Client(addr, thy_qualifier, timeout, compression, cancel_on_timeout)
+        self._queue = asyncio.Lock()
+        self._deadlines = threading.local() # see `deadline`
+        SyncClient._run(self.client.__aenter__())
+
+    @classmethod
+    def _event_loop(cls) -> asyncio.AbstractEventLoop:
+        with cls._loop_lock:
+            if cls._loop is None:
+                loop = asyncio.new_event_loop()
+                threading.Thread(target=loop.run_forever, name='IsaREPL-event-loop', daemon=True).start()
+                cls._loop = loop
+            return cls._loop
+
+    @classmethod
+    def _run(cls, coro):
+        loop = cls._event_loop()
+        try:
+            running = asyncio.get_running_loop()
+        except RuntimeError:
+            running = None
+        if running is loop:
+            coro.close()
+            raise RuntimeError("SyncClient cannot be called from its own event loop")
+        return asyncio.run_coroutine_threadsafe(coro, loop).result()
+
+    async def _serve(self, method, args, kwargs, deadline):
+        async with self._queue:
+            with self.client.deadline(deadline):
+                return await method(*args, **kwargs)
+
+    @contextlib.contextmanager
+    def deadline(self, seconds: float | None):
+        """
+        Like `Client.deadline`, but only for the requests made by the calling thread.
+        The deadline is applied on the event loop thread, to each request in turn.
+
+            with c.deadline(30):
+                c.eval(...)
+        """
+        old = getattr(self._deadlines, 'seconds', None)
+        if seconds is not None:
+            self._deadlines.seconds = seconds
+        try:
+            yield self
+        finally:
+            self._deadlines.seconds = old
+
+    def __getattr__(self, name):
+        if name == 'client':
+            raise AttributeError(name)
+        attr = getattr(self.client, name)
+        if not inspect.iscoroutinefunction(attr):
+            return attr
+
+        @functools.wraps(attr)
+        def call(*args, **kwargs):
+            return SyncClient._run(self._serve(attr, args, kwargs,
+                                               getattr(self._deadlines, 'seconds', None)))
+        return call
+
+    def close(self):
+        async def _close():
+            async with self._queue:
+                self.client.close()
+        SyncClient._run(_close())
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    @classmethod
+    def test_server(cls, addr, timeout=60):
+        return cls._run(Client.test_server(addr, timeout))
+
+    @classmethod
+    def kill_client(cls, addr, client_id, timeout=60) -> bool:
+        return cls._run(Client.kill_client(addr, client_id, timeout))
+
+    @classmethod
+    def scrape_metrics(cls, addr) -> str:
+        return cls._run(Client.scrape_metrics(addr))
+
+    @classmethod
+    def install_watcher(cls, addr, handler, *args, **kwargs):
+        """See `Client.install_watcher`. The `handler` runs on the event loop thread."""
+        return cls._run(Client.install_watcher(addr, handler, *args, **kwargs))
+
+    @classmethod
+    def subscribe(cls, addr):
+        """A blocking iterator of the `HealthEvent`s of the server at `addr`, see `Client.subscribe`"""
+        events = Client.subscribe(addr)
+
+        async def _next():
+            try:
+                return True, await events.__anext__()
+            except StopAsyncIteration:
+                return False, None
+        try:
+            while True:
+                more, event = cls._run(_next())
+                if not more:
+                    return
+                yield event
+        finally:
+            cls._run(events.aclose())
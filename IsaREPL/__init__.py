@@ -2,5 +2,6 @@ from importlib.metadata import version
 
 __version__ = version('IsaREPL')
 
-from .IsaREPL import Client, REPLFail, Position, IsabellePosition
+from .IsaREPL import Client, SyncClient, TrafficRecorder, REPLFail, Position, IsabellePosition, PluginSinkRef, HealthEvent
 from Isabelle_RPC_Host.unicode import get_SYMBOLS, get_REVERSE_SYMBOLS
+from .cluster import ServerProcess, Router, Cluster
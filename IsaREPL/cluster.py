@@ -0,0 +1,272 @@
+import asyncio
+import os
+import re
+import signal
+
+from .IsaREPL import Client, REPLFail
+
+_ACTIVE_CLIENTS = re.compile(r'^isa_repl_active_clients (\d+)$', re.MULTILINE)
+
+DEFAULT_SCRIPT = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'repl_server.sh')
+
+
+class ServerProcess:
+    """
+    A REPL server launched by `repl_server.sh` and supervised by this process.
+    The server is restarted whenever it terminates, until `stop` is called.
+
+    Attributes:
+        addr: The address on which the server listens
+        process: The current `asyncio.subprocess.Process` of the server, if running
+        restarts: How many times the server has been restarted
+    """
+
+    def __init__(self, addr: str, base_session: str, output_dir: str, options: list[str] = [],
+                 script: str = DEFAULT_SCRIPT, startup_timeout: int = 3600, log: str | None = None):
+        """
+        addr, base_session, output_dir, options: the arguments of `repl_server.sh`.
+        startup_timeout: how long in seconds to wait for the server to become reachable;
+            a cold start may build heaps.
+        log: a file to which the outputs of the server are appended. Discarded if None.
+        """
+        self.addr = addr
+        self.base_session = base_session
+        self.output_dir = output_dir
+        self.options = list(options)
+        self.script = script
+        self.startup_timeout = startup_timeout
+        self.log = log
+        self.process: asyncio.subprocess.Process | None = None
+        self.restarts = 0
+        self._supervisor: asyncio.Task | None = None
+        self._ready = asyncio.Event()
+
+    async def _launch(self):
+        os.makedirs(self.output_dir, exist_ok=True)
+        out = open(self.log, 'ab') if self.log else asyncio.subprocess.DEVNULL
+        try:
+            self.process = await asyncio.create_subprocess_exec(
+                self.script, self.addr, self.base_session, self.output_dir, *self.options,
+                stdin=asyncio.subprocess.DEVNULL, stdout=out, stderr=asyncio.subprocess.STDOUT,
+                start_new_session=True)
+        finally:
+            if self.log:
+                out.close()  # type: ignore[union-attr]
+
+    async def _wait_reachable(self):
+        assert self.process is not None
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + self.startup_timeout
+        while loop.time() < deadline:
+            if self.process.returncode is not None:
+                raise REPLFail(f"The REPL server on {self.addr} terminated with code {self.process.returncode} during startup")
+            try:
+                await Client.test_server(self.addr, max(1, min(10, deadline - loop.time())))
+                return
+            except (OSError, REPLFail, asyncio.TimeoutError):
+                await asyncio.sleep(1)
+        raise REPLFail(f"The REPL server on {self.addr} is not reachable after {self.startup_timeout} seconds")
+
+    async def _supervise(self):
+        while True:
+            assert self.process is not None
+            await self.process.wait()
+            self._ready.clear()
+            self.restarts += 1
+            await asyncio.sleep(2)
+            await self._launch()
+            try:
+                await self._wait_reachable()
+                self._ready.set()
+            except REPLFail:
+                pass  # the process terminated again, so it is relaunched by the next round
+
+    async def start(self):
+        """Launch the server, wait until it is reachable, and keep it alive"""
+        await self._launch()
+        await self._wait_reachable()
+        self._ready.set()
+        self._supervisor = asyncio.create_task(self._supervise())
+
+    @property
+    def is_ready(self) -> bool:
+        return self._ready.is_set()
+
+    async def stop(self):
+        """Stop supervising the server and terminate it"""
+        if self._supervisor is not None:
+            self._supervisor.cancel()
+            self._supervisor = None
+        self._ready.clear()
+        if self.process is not None and self.process.returncode is None:
+            # `repl_server.sh` runs Isabelle in the same process group
+            try:
+                os.killpg(self.process.pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+            await self.process.wait()
+
+
+class Router:
+    """
+    A front end spreading new clients over several REPL servers.
+
+    A client is routed to the least loaded server, preferring the servers that have
+    already served the same `thy_qualifier`, since they have the imported theories warm,
+    as long as they are not more than `affinity_slack` clients busier than the least
+    loaded one. The load of a server is the number of its active clients, scraped from
+    its metrics every `refresh_interval` seconds and counted locally in between, so
+    servers shared with other routers or other machines are balanced as well.
+    Servers refusing new connections as busy (see `HealthEvent`) are skipped.
+    """
+
+    def __init__(self, addrs: list[str], affinity_slack: int = 4, refresh_interval: float = 5):
+        self.addrs = list(addrs)
+        self.affinity_slack = affinity_slack
+        self.refresh_interval = refresh_interval
+        self.loads: dict[str, int] = {addr: 0 for addr in self.addrs}
+        self.qualifiers: dict[str, set[str]] = {addr: set() for addr in self.addrs}
+        self._refreshed = float('-inf')
+        self._lock = asyncio.Lock()
+
+    def add_server(self, addr: str):
+        if addr not in self.loads:
+            self.addrs.append(addr)
+            self.loads[addr] = 0
+            self.qualifiers[addr] = set()
+
+    def remove_server(self, addr: str):
+        if addr in self.loads:
+            self.addrs.remove(addr)
+            del self.loads[addr]
+            del self.qualifiers[addr]
+
+    async def _scrape_load(self, addr: str) -> int | None:
+        try:
+            metrics = await Client.scrape_metrics(addr)
+        except (OSError, REPLFail):
+            return None
+        m = _ACTIVE_CLIENTS.search(metrics)
+        return int(m.group(1)) if m else None
+
+    async def refresh(self):
+        """Scrape the load of every server. Unreachable servers are deprioritized until the next refresh."""
+        loads = await asyncio.gather(*(self._scrape_load(addr) for addr in self.addrs))
+        for addr, load in zip(self.addrs, loads):
+            self.loads[addr] = load if load is not None else 1 << 30
+        self._refreshed = asyncio.get_running_loop().time()
+
+    def _candidates(self, thy_qualifier: str) -> list[str]:
+        ordered = sorted(self.addrs, key=lambda addr: self.loads[addr])
+        if not ordered:
+            return []
+        least = self.loads[ordered[0]]
+        warm = [addr for addr in ordered
+                if thy_qualifier in self.qualifiers[addr] and self.loads[addr] <= least + self.affinity_slack]
+        return warm + [addr for addr in ordered if addr not in warm]
+
+    async def connect(self, thy_qualifier: str, timeout: int | None = 3600) -> Client:
+        """
+        Connect a new client to the chosen server. The client must be released
+        by `release` when it is closed; `session` does both.
+        """
+        async with self._lock:
+            if asyncio.get_running_loop().time() - self._refreshed >= self.refresh_interval:
+                await self.refresh()
+            candidates = self._candidates(thy_qualifier)
+            if candidates:
+                self.loads[candidates[0]] += 1
+        error = None
+        for addr in candidates:
+            client = Client(addr, thy_qualifier, timeout)
+            try:
+                await client.__aenter__()
+            except (OSError, REPLFail) as e:
+                client.close()
+                error = e
+                self.loads[addr] += 1 << 30  # avoid it until the next refresh
+                continue
+            if addr != candidates[0]:
+                self.loads[addr] += 1
+                self.loads[candidates[0]] -= 1
+            self.qualifiers[addr].add(thy_qualifier)
+            return client
+        if candidates:
+            self.loads[candidates[0]] -= 1
+        raise REPLFail(f"No REPL server accepts new clients: {error}")
+
+    def release(self, client: Client):
+        client.close()
+        if client.addr in self.loads and self.loads[client.addr] > 0:
+            self.loads[client.addr] -= 1
+
+    def session(self, thy_qualifier: str, timeout: int | None = 3600):
+        """
+        Usage:
+            async with router.session('HOL') as client:
+                await client.eval(...)
+        """
+        router = self
+
+        class _Session:
+            async def __aenter__(self):
+                self.client = await router.connect(thy_qualifier, timeout)
+                return self.client
+
+            async def __aexit__(self, exc_type, exc_value, traceback):
+                router.release(self.client)
+        return _Session()
+
+
+class Cluster:
+    """
+    K REPL servers on this machine, each a separate Poly/ML process with its own heap,
+    supervised and exposed as one logical endpoint through a `Router`.
+    Servers on other machines can be joined to the router by `external`.
+
+    Usage:
+        async with Cluster('HOL', '/tmp/repl', size=8, options=['-o', 'threads=16']) as cluster:
+            async with cluster.router.session('HOL') as client:
+                await client.eval(...)
+    """
+
+    def __init__(self, base_session: str, output_dir: str, size: int, host: str = '127.0.0.1',
+                 base_port: int = 6666, options: list[str] = [], external: list[str] = [],
+                 script: str = DEFAULT_SCRIPT, startup_timeout: int = 3600, log_dir: str | None = None,
+                 **router_options):
+        """
+        output_dir: every server i stores its files in `output_dir/i`.
+        options: options of `repl_server.sh`, shared by all servers.
+        log_dir: if given, the outputs of server i are appended to `log_dir/i.log`.
+        router_options: passed to `Router`.
+        """
+        self.servers = [
+            ServerProcess(f"{host}:{base_port + i}", base_session, os.path.join(output_dir, str(i)),
+                          options, script, startup_timeout,
+                          os.path.join(log_dir, f"{i}.log") if log_dir else None)
+            for i in range(size)]
+        self.router = Router(list(external), **router_options)
+
+    async def start(self):
+        """
+        Launch all servers. The first server is launched alone, so that the shared heap
+        prebuilt by `repl_server.sh` is built only once.
+        """
+        if not self.servers:
+            return
+        await self.servers[0].start()
+        await asyncio.gather(*(server.start() for server in self.servers[1:]))
+        for server in self.servers:
+            self.router.add_server(server.addr)
+
+    async def stop(self):
+        await asyncio.gather(*(server.stop() for server in self.servers))
+        for server in self.servers:
+            self.router.remove_server(server.addr)
+
+    async def __aenter__(self):
+        await self.start()
+        return self
+
+    async def __aexit__(self, exc_type, exc_value, traceback):
+        await self.stop()
@@ -0,0 +1,170 @@
+"""
+Replay the traffic recorded by `TrafficRecorder` against a REPL server, and report the latencies.
+
+    python -m IsaREPL.replay RECORDING ADDRESS [--concurrency N] [--speedup X] [--json OUT]
+
+Every recorded session is replayed on its own connection, sending the recorded requests and
+awaiting the same number of responses. Sessions start in the recorded order, at most
+`concurrency` at a time. With a positive `speedup`, the requests are paced at the recorded
+times divided by `speedup`; with 0, every request is sent as soon as the previous response arrives.
+
+Recorded cancellations (`\\005cancel`) are dropped: their time within the request is not recorded,
+and sending them right behind their requests would cancel at once. The cancelled requests are
+thus replayed to completion, and their latencies are not comparable with the recorded ones.
+"""
+
+import argparse
+import asyncio
+import json
+import sys
+import time
+import zlib
+
+import msgpack as mp
+
+from .IsaREPL import _Transport
+
+CANCEL = "\x05cancel" # not replayed, see the module docstring
+
+
+def load(path: str) -> tuple[dict, dict[int, list]]:
+    """The header of a recording and its records grouped by session, in order"""
+    sessions: dict[int, list] = {}
+    with open(path, 'rb') as f:
+        unpacker = mp.Unpacker(f, unicode_errors='replace')
+        header = next(unpacker, None)
+        if not isinstance(header, dict) or 'isarepl' not in header:
+            raise ValueError(f"{path} is not a recording of IsaREPL.TrafficRecorder")
+        for session, start, requests, response_bytes, latency, error in unpacker:
+            sessions.setdefault(session, []).append((start, requests, response_bytes, latency, error))
+    return header, sessions
+
+
+def command_of(requests: list) -> str:
+    """The name of the command of a recorded request, as labelled in the report"""
+    for value in requests:
+        if isinstance(value, str):
+            if value.startswith('\x05'):
+                return value[1:]
+            return 'eval'
+    return 'response'
+
+
+def percentile(values: list[float], q: float) -> float:
+    values = sorted(values)
+    if not values:
+        return float('nan')
+    k = min(len(values) - 1, max(0, round(q * (len(values) - 1))))
+    return values[k]
+
+
+async def replay_session(addr: str, records: list, origin: float, speedup: float, results: list):
+    conn = await _Transport.open(addr)
+    try:
+        for i, (start, requests, _, recorded_latency, recorded_error) in enumerate(records):
+            if speedup > 0:
+                delay = origin + start / speedup - time.monotonic()
+                if delay > 0:
+                    await asyncio.sleep(delay)
+            if i == 0 and requests and isinstance(requests[0], str) and ';zlib' in requests[0]:
+                conn.inflate = zlib.decompressobj(-zlib.MAX_WBITS) # the responses are compressed
+            sent = time.monotonic()
+            for value in requests:
+                if value == CANCEL:
+                    continue
+                conn.write(mp.packb(value))
+            await conn.drain()
+            response = await conn.next_message()
+            latency = time.monotonic() - sent
+            error = isinstance(response, list) and len(response) >= 2 and response[1] is not None
+            command = command_of(requests) if i else 'handshake'
+            results.append((command, latency, recorded_latency, error, recorded_error))
+    finally:
+        conn.close()
+        await conn.wait_closed()
+
+
+async def replay(path: str, addr: str, concurrency: int = 1, speedup: float = 0) -> dict:
+    """
+    Replay the recording at `path` against the server at `addr`.
+    Returns the report, a dictionary from command names (and 'all') to statistics.
+    """
+    _, sessions = load(path)
+    results: list = []
+    failures: list = []
+    semaphore = asyncio.Semaphore(max(1, concurrency))
+    origin = time.monotonic()
+
+    async def run(records):
+        async with semaphore:
+            try:
+                await replay_session(addr, records, origin, speedup, results)
+            except Exception as e:
+                failures.append(repr(e))
+
+    started = time.monotonic()
+    await asyncio.gather(*(run(records) for _, records in sorted(sessions.items())))
+    elapsed = time.monotonic() - started
+
+    by_command: dict[str, list] = {'all': results}
+    for r in results:
+        by_command.setdefault(r[0], []).append(r)
+    report = {}
+    for command, rs in sorted(by_command.items()):
+        latencies = [r[1] for r in rs]
+        recorded = [r[2] for r in rs]
+        report[command] = {
+            'count': len(rs),
+            'p50': percentile(latencies, 0.5),
+            'p90': percentile(latencies, 0.9),
+            'p99': percentile(latencies, 0.99),
+            'max': max(latencies, default=float('nan')),
+            'recorded_p50': percentile(recorded, 0.5),
+            'recorded_p99': percentile(recorded, 0.99),
+            'errors': sum(1 for r in rs if r[3]),
+            'new_errors': sum(1 for r in rs if r[3] and not r[4]),
+        }
+    report['all']['sessions'] = len(sessions)
+    report['all']['failed_sessions'] = len(failures)
+    report['all']['seconds'] = elapsed
+    report['all']['requests_per_second'] = len(results) / elapsed if elapsed > 0 else float('nan')
+    if failures:
+        report['all']['failures'] = failures
+    return report
+
+
+def print_report(report: dict, out=sys.stdout):
+    print(f"{'command':<20} {'count':>7} {'p50 ms':>9} {'p90 ms':>9} {'p99 ms':>9} {'max ms':>9} "
+          f"{'rec p50':>9} {'errors':>7} {'new':>5}", file=out)
+    for command, r in report.items():
+        print(f"{command:<20} {r['count']:>7} {1000 * r['p50']:>9.2f} {1000 * r['p90']:>9.2f} "
+              f"{1000 * r['p99']:>9.2f} {1000 * r['max']:>9.2f} {1000 * r['recorded_p50']:>9.2f} "
+              f"{r['errors']:>7} {r['new_errors']:>5}", file=out)
+    a = report['all']
+    print(f"{a['sessions']} sessions ({a['failed_sessions']} failed) in {a['seconds']:.2f}s, "
+          f"{a['requests_per_second']:.1f} requests/s", file=out)
+    for failure in a.get('failures', []):
+        print(f"failed: {failure}", file=out)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m IsaREPL.replay',
+                                     description="Replay a recording of IsaREPL.TrafficRecorder against a server")
+    parser.add_argument('recording')
+    parser.add_argument('address', help="host:port or unix:/path of the server")
+    parser.add_argument('--concurrency', type=int, default=1, help="sessions replayed at a time (default 1)")
+    parser.add_argument('--speedup', type=float, default=0,
+                        help="pace the requests at the recorded times divided by this factor; "
+                             "0 (the default) sends them back to back")
+    parser.add_argument('--json', metavar='OUT', help="also write the report as JSON to OUT")
+    args = parser.parse_args(argv)
+    report = asyncio.run(replay(args.recording, args.address, args.concurrency, args.speedup))
+    print_report(report)
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(report, f, indent=2)
+    return 1 if report['all']['failed_sessions'] else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
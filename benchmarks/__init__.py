@@ -0,0 +1,8 @@
+"""
+Benchmarks of the Python client against a local mock of the REPL server, which need no Isabelle.
+
+    python -m benchmarks.bench_client [--quick] [--json OUT]
+
+`benchmarks.mock_server` speaks the protocol of `library/Server.ML` with synthetic responses.
+`benchmarks.bench_server` benchmarks a real server end to end instead.
+"""
@@ -0,0 +1,158 @@
+"""
+Benchmarks of the Python client against `benchmarks.mock_server`, run in the same process.
+
+    python -m benchmarks.bench_client [--quick] [--only NAME ...] [--json OUT]
+
+    connect        open a connection and complete the handshake
+    round_trip     a small request and its response (`num_processor`)
+    eval_decode    receive and parse an `eval` response of many large command outputs
+    parse_output   `CommandOutput.parse`, without the network
+    translate_pos  `translate_position` over a large source, at increasing offsets
+
+Every benchmark reports the seconds per operation (median and best of the repetitions),
+and the throughput where meaningful, so that runs on the same machine can be compared.
+"""
+
+import argparse
+import asyncio
+import json
+import statistics
+import sys
+import time
+
+import msgpack as mp
+
+from IsaREPL.IsaREPL import Client, CommandOutput
+from .mock_server import MockServer, command_output
+
+
+def _summary(samples: list[float], ops: int, **extra) -> dict:
+    """Statistics of `samples`, the seconds of the repetitions of `ops` operations each"""
+    per_op = [s / ops for s in samples]
+    return {'ops': ops, 'repeat': len(samples), 'median': statistics.median(per_op),
+            'best': min(per_op), **extra}
+
+
+async def bench_connect(addr: str, n: int, repeat: int) -> dict:
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for _ in range(n):
+            async with Client(addr, 'HOL') as client:
+                pass
+        samples.append(time.perf_counter() - start)
+    return _summary(samples, n)
+
+
+async def bench_round_trip(addr: str, n: int, repeat: int) -> dict:
+    samples = []
+    async with Client(addr, 'HOL') as client:
+        for _ in range(repeat):
+            start = time.perf_counter()
+            for _ in range(n):
+                await client.num_processor()
+            samples.append(time.perf_counter() - start)
+    return _summary(samples, n)
+
+
+async def bench_eval_decode(addr: str, server: MockServer, n: int, repeat: int,
+                            commands: int, state_size: int) -> dict:
+    server.commands, server.state_size, server.messages = commands, state_size, 4
+    size = len(server.eval_response())
+    samples = []
+    async with Client(addr, 'HOL') as client:
+        for _ in range(repeat):
+            start = time.perf_counter()
+            for _ in range(n):
+                outputs = await client.eval("lemma True by simp")
+                assert len(outputs) == commands
+            samples.append(time.perf_counter() - start)
+    ret = _summary(samples, n, response_bytes=size)
+    ret['MB_per_second'] = size / ret['median'] / 1e6
+    return ret
+
+
+def bench_parse_output(n: int, repeat: int) -> dict:
+    # decoded as the client does, so that the raw outputs have the same types
+    raw = mp.unpackb(mp.packb([command_output(i, 256, 4) for i in range(n)]), unicode_errors='replace')
+    samples = []
+    for _ in range(repeat):
+        outputs = [list(o) for o in raw] # `parse` pops entries of the plugin outputs
+        for o in outputs:
+            o[6] = dict(o[6])
+        start = time.perf_counter()
+        for o in outputs:
+            CommandOutput.parse(o)
+        samples.append(time.perf_counter() - start)
+    return _summary(samples, n)
+
+
+async def bench_translate_pos(addr: str, n: int, repeat: int, lines: int) -> dict:
+    src = "".join(f"  apply (simp add: lemma_{i} \\<open>x \\<le> y\\<close>)\n" for i in range(lines))
+    samples = []
+    async with Client(addr, 'HOL') as client:
+        for _ in range(repeat):
+            start = time.perf_counter()
+            translate = await client.translate_position(src)
+            step = max(1, (len(src) - 1) // n)
+            for offset in range(1, 1 + step * n, step):
+                translate(offset)
+            samples.append(time.perf_counter() - start)
+    return _summary(samples, n, source_chars=len(src))
+
+
+BENCHMARKS = ['connect', 'round_trip', 'eval_decode', 'parse_output', 'translate_pos']
+
+
+async def run(only: list[str] | None = None, quick: bool = False) -> dict:
+    """Run the benchmarks named in `only` (all if None) and return their results by name"""
+    scale = 10 if quick else 1
+    repeat = 3 if quick else 5
+    server = MockServer()
+    addr = await server.start()
+    results = {}
+    try:
+        for name in only or BENCHMARKS:
+            if name == 'connect':
+                results[name] = await bench_connect(addr, 200 // scale, repeat)
+            elif name == 'round_trip':
+                results[name] = await bench_round_trip(addr, 2000 // scale, repeat)
+            elif name == 'eval_decode':
+                results[name] = await bench_eval_decode(addr, server, max(1, 20 // scale), repeat,
+                                                        2000, 4096)
+            elif name == 'parse_output':
+                results[name] = bench_parse_output(20000 // scale, repeat)
+            elif name == 'translate_pos':
+                results[name] = await bench_translate_pos(addr, 5000 // scale, repeat, 20000 // scale)
+            else:
+                raise ValueError(f"unknown benchmark {name}")
+    finally:
+        await server.stop()
+    return results
+
+
+def print_results(results: dict, out=sys.stdout):
+    print(f"{'benchmark':<15} {'ops':>7} {'median us/op':>14} {'best us/op':>12}  extra", file=out)
+    for name, r in results.items():
+        extra = ", ".join(f"{k}={v:.1f}" if isinstance(v, float) else f"{k}={v}"
+                          for k, v in r.items() if k not in ('ops', 'repeat', 'median', 'best'))
+        print(f"{name:<15} {r['ops']:>7} {1e6 * r['median']:>14.2f} {1e6 * r['best']:>12.2f}  {extra}",
+              file=out)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m benchmarks.bench_client',
+                                     description="Benchmark the client against a mock REPL server")
+    parser.add_argument('--quick', action='store_true', help="a tenth of the iterations, e.g. for CI")
+    parser.add_argument('--only', nargs='+', choices=BENCHMARKS, help="run only these benchmarks")
+    parser.add_argument('--json', metavar='OUT', help="also write the results as JSON to OUT")
+    args = parser.parse_args(argv)
+    results = asyncio.run(run(args.only, args.quick))
+    print_results(results)
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump({'python': sys.version.split()[0], 'results': results}, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,347 @@
+"""
+End-to-end benchmarks of a running REPL server, for sizing deployments.
+
+    python -m benchmarks.bench_server ADDRESS [--theories THY ...] [--concurrency N]
+                                              [--sledgehammer] [--only NAME ...] [--json OUT]
+
+    file_cold      `file` up to the end of every theory, after `clean_cache`
+    file_warm      the same request again, resumed from the cached state
+    file_random    `file` at random lines of every theory, using the cache (seeded by --seed)
+    eval           `eval` throughput of a theory of small lemmas, at 1, 2, 4, ..., N concurrent clients
+    lex            `lex` and `fast_lex` of every theory
+    hammer         `hammer` on a small goal (with --sledgehammer, which needs the provers)
+    premise_sel    `premise_selection` on the same goal (with --sledgehammer)
+    examples       the example scripts `examples/eval_file.py` on every theory, and
+                   `examples/example_sledgehammer.py` with --sledgehammer, as subprocesses
+
+The `file` scenarios follow `examples/eval_file.py`, and `hammer` and `premise_sel` follow
+`examples/example_sledgehammer.py` and `examples/premise_selection.py`.
+Theories are paths, relative ones being resolved against ISABELLE_HOME (given by --isabelle-home,
+the environment, or `isabelle getenv`), which must be the same directory on the server.
+
+Every scenario records the latencies of its requests and the heap statistics of the server
+(from `ML_Statistics`, through `Client.scrape_metrics`) before and after it.
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import random
+import subprocess
+import sys
+import time
+
+from IsaREPL import Client, REPLFail
+from IsaREPL.replay import percentile
+
+DEFAULT_THEORIES = ['src/HOL/List.thy', 'src/HOL/Groups_List.thy']
+SCENARIOS = ['file_cold', 'file_warm', 'file_random', 'eval', 'lex', 'hammer', 'premise_sel', 'examples']
+EXAMPLES = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'examples')
+
+# the metrics of `Server.render_metrics` reported as the heap statistics
+HEAP_METRICS = {
+    'isa_repl_heap_size_bytes': 'heap_size',
+    'isa_repl_heap_free_last_gc_bytes': 'heap_free_last_gc',
+    'isa_repl_heap_free_last_full_gc_bytes': 'heap_free_last_full_gc',
+    'isa_repl_full_gcs_total': 'full_gcs',
+    'isa_repl_gc_time_fraction': 'gc_time_fraction',
+    'isa_repl_ml_threads': 'ml_threads',
+    'isa_repl_active_clients': 'active_clients',
+    'isa_repl_evaluation_cache_entries': 'evaluation_cache_entries',
+}
+
+HAMMER_THEORY = """
+theory Bench_Hammer
+  imports Main
+begin
+definition "ONE = (1::nat)"
+"""
+HAMMER_GOAL = """
+lemma "ONE + ONE = 2"
+"""
+
+
+def isabelle_home(given: str | None) -> str | None:
+    if given:
+        return given
+    if os.environ.get('ISABELLE_HOME'):
+        return os.environ['ISABELLE_HOME']
+    try:
+        return subprocess.run(['isabelle', 'getenv', '-b', 'ISABELLE_HOME'], capture_output=True,
+                              text=True, check=True).stdout.strip() or None
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def parse_metrics(text: str) -> dict[str, float]:
+    """The heap statistics among the metrics in the text exposition format of Prometheus"""
+    ret = {}
+    for line in text.splitlines():
+        parts = line.split()
+        if len(parts) == 2 and parts[0] in HEAP_METRICS:
+            try:
+                ret[HEAP_METRICS[parts[0]]] = float(parts[1])
+            except ValueError:
+                pass
+    return ret
+
+
+def summarize(latencies: list[float], errors: int = 0, **extra) -> dict:
+    return {'count': len(latencies), 'errors': errors,
+            'p50': percentile(latencies, 0.5), 'p90': percentile(latencies, 0.9),
+            'p99': percentile(latencies, 0.99), 'max': max(latencies, default=float('nan')),
+            'total': sum(latencies), **extra}
+
+
+async def timed(latencies: list[float], coro) -> bool:
+    """Await `coro`, appending its seconds to `latencies`. False if it raised REPLFail."""
+    start = time.perf_counter()
+    try:
+        await coro
+        return True
+    except REPLFail:
+        return False
+    finally:
+        latencies.append(time.perf_counter() - start)
+
+
+def line_count(path: str) -> int:
+    with open(path, encoding='utf-8') as f:
+        return sum(1 for _ in f)
+
+
+async def file_cold(client: Client, theories: list[str], args) -> dict:
+    latencies, errors = [], 0
+    for thy in theories:
+        await client.clean_cache()
+        if not await timed(latencies, client.file(thy, line=line_count(thy), cache_position=True,
+                                                  use_cache=True)):
+            errors += 1
+    return summarize(latencies, errors)
+
+
+async def file_warm(client: Client, theories: list[str], args) -> dict:
+    latencies, errors = [], 0
+    for thy in theories:
+        await client.file(thy, line=line_count(thy), cache_position=True, use_cache=True)
+        for _ in range(args.repeat):
+            if not await timed(latencies, client.file(thy, line=line_count(thy), cache_position=True,
+                                                      use_cache=True)):
+                errors += 1
+    return summarize(latencies, errors)
+
+
+async def file_random(client: Client, theories: list[str], args) -> dict:
+    rng = random.Random(args.seed)
+    latencies, errors = [], 0
+    for thy in theories:
+        lines = line_count(thy)
+        for _ in range(args.positions):
+            if not await timed(latencies, client.file(thy, line=rng.randint(1, lines), cache_position=True,
+                                                      use_cache=True)):
+                errors += 1
+    return summarize(latencies, errors)
+
+
+async def eval_checked(client: Client, source: str):
+    """`eval`, raising REPLFail if any command fails"""
+    outputs = await client.eval(source)
+    errors = [e for o in outputs or [] for e in o.errors]
+    if errors:
+        raise REPLFail('\n'.join(errors))
+
+
+def eval_theory(name: str, lemmas: int) -> str:
+    return f"theory {name} imports Main begin\n" + "".join(
+        f"lemma bench_{i}: \"rev (rev (xs::nat list)) @ [{i}] = xs @ [{i}]\" by simp\n"
+        for i in range(lemmas)) + "end\n"
+
+
+async def eval_scenario(addr: str, args) -> dict:
+    levels, n = [], 1
+    while n < args.concurrency:
+        levels.append(n)
+        n *= 2
+    levels.append(args.concurrency)
+    ret = {}
+    for level in levels:
+        latencies: list[float] = []
+        errors = 0
+
+        async def worker(index: int):
+            nonlocal errors
+            async with Client(addr, f'Bench{index}', timeout=args.deadline) as client:
+                await client.set_register_thy(False)
+                for _ in range(args.repeat):
+                    if not await timed(latencies, eval_checked(client, eval_theory('Bench_Eval', args.lemmas))):
+                        errors += 1
+
+        start = time.perf_counter()
+        await asyncio.gather(*(worker(i) for i in range(level)))
+        elapsed = time.perf_counter() - start
+        ret[str(level)] = summarize(latencies, errors, seconds=elapsed,
+                                    evals_per_second=len(latencies) / elapsed,
+                                    commands_per_second=len(latencies) * (args.lemmas + 2) / elapsed)
+    return ret
+
+
+async def lex_scenario(client: Client, theories: list[str], args) -> dict:
+    sources = []
+    for thy in theories:
+        with open(thy, encoding='utf-8') as f:
+            sources.append(f.read())
+    ret = {}
+    for name, lex in (('lex', client.lex), ('fast_lex', client.fast_lex)):
+        latencies, errors = [], 0
+        for src in sources:
+            for _ in range(args.repeat):
+                if not await timed(latencies, lex(src)):
+                    errors += 1
+        ret[name] = summarize(latencies, errors, chars=sum(map(len, sources)))
+    return ret
+
+
+async def hammer_scenario(client: Client, args, premise_selection: bool) -> dict:
+    await client.eval(HAMMER_THEORY)
+    await client.eval(HAMMER_GOAL)
+    latencies, errors = [], 0
+    for _ in range(args.repeat):
+        if premise_selection:
+            request = client.premise_selection('final', 32, ['mesh'], {}, 'pretty')
+        else:
+            request = client.hammer(args.hammer_timeout)
+        if not await timed(latencies, request):
+            errors += 1
+    await client.eval("oops\nend")
+    return summarize(latencies, errors)
+
+
+def examples_scenario(addr: str, theories: list[str], args) -> dict:
+    runs = [[os.path.join(EXAMPLES, 'eval_file.py'), addr, f"{thy}:{line_count(thy)}:0"] for thy in theories]
+    if args.sledgehammer:
+        runs.append([os.path.join(EXAMPLES, 'example_sledgehammer.py'), addr])
+    ret = {}
+    for argv in runs:
+        start = time.perf_counter()
+        proc = subprocess.run([sys.executable, *argv], capture_output=True, text=True)
+        elapsed = time.perf_counter() - start
+        name = os.path.basename(argv[0]) + (f" {argv[2]}" if len(argv) > 2 else "")
+        ret[name] = {'seconds': elapsed, 'returncode': proc.returncode,
+                     'errors': int(proc.returncode != 0 or 'errors encountered' in proc.stdout)}
+        if proc.returncode != 0:
+            ret[name]['stderr'] = proc.stderr[-2000:]
+    return ret
+
+
+async def run(addr: str, theories: list[str], args) -> dict:
+    """Run the scenarios selected by `args` and return the report"""
+    await Client.test_server(addr)
+    selected = args.only or [s for s in SCENARIOS
+                             if args.sledgehammer or s not in ('hammer', 'premise_sel')]
+    report = {'server': addr, 'time': time.time(), 'theories': theories,
+              'config': {k: v for k, v in vars(args).items() if k not in ('address', 'json')},
+              'heap': parse_metrics(await Client.scrape_metrics(addr)),
+              'scenarios': {}}
+    for name in selected:
+        print(f"running {name} ...", file=sys.stderr, flush=True)
+        heap_before = parse_metrics(await Client.scrape_metrics(addr))
+        start = time.perf_counter()
+        if name == 'eval':
+            result = await eval_scenario(addr, args)
+        elif name == 'examples':
+            result = await asyncio.to_thread(examples_scenario, addr, theories, args)
+        else:
+            async with Client(addr, 'HOL', timeout=args.deadline) as client:
+                await client.set_register_thy(False)
+                if name == 'file_cold':
+                    result = await file_cold(client, theories, args)
+                elif name == 'file_warm':
+                    result = await file_warm(client, theories, args)
+                elif name == 'file_random':
+                    result = await file_random(client, theories, args)
+                elif name == 'lex':
+                    result = await lex_scenario(client, theories, args)
+                elif name in ('hammer', 'premise_sel'):
+                    result = await hammer_scenario(client, args, name == 'premise_sel')
+                else:
+                    raise ValueError(f"unknown scenario {name}")
+        report['scenarios'][name] = {
+            'seconds': time.perf_counter() - start,
+            'result': result,
+            'heap_before': heap_before,
+            'heap_after': parse_metrics(await Client.scrape_metrics(addr)),
+        }
+    return report
+
+
+def print_report(report: dict, out=sys.stdout):
+    def row(name, r):
+        if 'p50' in r:
+            print(f"{name:<40} {r['count']:>6} {r['errors']:>6} {1000 * r['p50']:>10.1f} "
+                  f"{1000 * r['p90']:>10.1f} {1000 * r['max']:>10.1f}"
+                  + (f"  {r['evals_per_second']:.2f} evals/s" if 'evals_per_second' in r else ""), file=out)
+        else:
+            print(f"{name:<40} {1:>6} {r['errors']:>6} {1000 * r['seconds']:>10.1f}", file=out)
+
+    print(f"{'scenario':<40} {'count':>6} {'errors':>6} {'p50 ms':>10} {'p90 ms':>10} {'max ms':>10}", file=out)
+    for name, s in report['scenarios'].items():
+        result = s['result']
+        if 'count' in result:
+            row(name, result)
+        else:
+            for sub, r in result.items():
+                row(f"{name} {sub}", r)
+        heap = s['heap_after'].get('heap_size')
+        if heap is not None:
+            print(f"{'':<40} heap {heap / 2**20:.0f} MiB, "
+                  f"{s['heap_after'].get('full_gcs', 0) - s['heap_before'].get('full_gcs', 0):.0f} full GCs",
+                  file=out)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m benchmarks.bench_server',
+                                     description="Benchmark a running REPL server end to end")
+    parser.add_argument('address', help="host:port or unix:/path of the server")
+    parser.add_argument('--theories', nargs='+', default=DEFAULT_THEORIES,
+                        help="theory files, relative to ISABELLE_HOME unless absolute "
+                             f"(default: {' '.join(DEFAULT_THEORIES)})")
+    parser.add_argument('--isabelle-home', help="resolves relative theory paths")
+    parser.add_argument('--only', nargs='+', choices=SCENARIOS, help="run only these scenarios")
+    parser.add_argument('--concurrency', type=int, default=4, help="the most concurrent clients of `eval`")
+    parser.add_argument('--lemmas', type=int, default=50, help="lemmas of the theory evaluated by `eval`")
+    parser.add_argument('--repeat', type=int, default=3, help="repetitions of every request")
+    parser.add_argument('--positions', type=int, default=10, help="random positions per theory")
+    parser.add_argument('--seed', type=int, default=0, help="seed of the random positions")
+    parser.add_argument('--sledgehammer', action='store_true',
+                        help="also run `hammer` and `premise_selection`, which need the provers")
+    parser.add_argument('--hammer-timeout', type=int, default=30, help="seconds given to `hammer`")
+    parser.add_argument('--deadline', type=float, default=3600, help="client-side seconds per request")
+    parser.add_argument('--json', metavar='OUT', help="also write the report as JSON to OUT")
+    args = parser.parse_args(argv)
+    if args.concurrency < 1:
+        parser.error("--concurrency must be positive")
+
+    home = isabelle_home(args.isabelle_home)
+    theories = []
+    for thy in args.theories:
+        if not os.path.isabs(thy):
+            if home is None:
+                parser.error(f"cannot resolve {thy}: ISABELLE_HOME is unknown, use --isabelle-home")
+            thy = os.path.join(home, thy)
+        if not os.path.isfile(thy):
+            parser.error(f"no such theory file: {thy}")
+        theories.append(thy)
+
+    report = asyncio.run(run(args.address, theories, args))
+    print_report(report)
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(report, f, indent=2)
+    failed = sum(r.get('errors', 0) for s in report['scenarios'].values()
+                 for r in ([s['result']] if 'errors' in s['result'] else s['result'].values()))
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
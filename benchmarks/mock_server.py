@@ -0,0 +1,226 @@
+"""
+A mock of the REPL server speaking the protocol of `library/Server.ML`, for benchmarking clients
+without Isabelle. Responses are synthetic, of sizes configured by the attributes of `MockServer`,
+and packed once and reused, so that the time measured by clients is spent mostly on their side.
+
+    python -m benchmarks.mock_server 127.0.0.1:6666
+
+Supported requests: the handshake (with the `zlib` feature), the short connections `heartbeat`,
+`metrics` and `kill <id>`, plain `eval` and the commands `\\005eval`, `\\005lex`, `\\005lex'`,
+`\\005lex_file`, `\\005file`, `\\005file_ext`, `\\005symbpos`, `\\005numcpu`, `\\005session-of`,
+`\\005path`, `\\005thy_header`, `\\005record`, `\\005rollback`, `\\005history`, `\\005clean_cache`,
+`\\005clean_history`, `\\005trace`, `\\005notrace`, `\\005register_thy`, `\\005no_register_thy`,
+`\\005cmd_timeout`, `\\005qualifier`, `\\005hammer` and `\\005premise_selection`.
+`\\005cancel` is ignored. Since the arguments of other commands are unknown, so is where the
+next request starts: they are answered by an error and the connection is closed.
+"""
+
+import argparse
+import asyncio
+import os
+import zlib
+
+import msgpack as mp
+
+# the number of arguments following every command
+ARITY = {
+    "\x05eval": 1, "\x05lex": 1, "\x05lex'": 1, "\x05lex_file": 1, "\x05file": 1,
+    "\x05file_ext": 1, "\x05symbpos": 1, "\x05numcpu": 0, "\x05session-of": 1, "\x05path": 1,
+    "\x05thy_header": 1, "\x05record": 1, "\x05rollback": 1, "\x05history": 0,
+    "\x05clean_cache": 0, "\x05clean_history": 0, "\x05trace": 0, "\x05notrace": 0,
+    "\x05register_thy": 0, "\x05no_register_thy": 0, "\x05cmd_timeout": 1, "\x05qualifier": 1,
+    "\x05hammer": 1, "\x05premise_selection": 1,
+}
+
+
+def position(line: int, offset: int, end_offset: int = 0, file: str = ""):
+    """A position as packed by `Server.pos_packer`"""
+    return [line, offset, end_offset, ["", file, ""]]
+
+
+def command_output(index: int, state_size: int, messages: int):
+    """A command output as packed by `REPL_Serialize.command_output_packer`"""
+    return [
+        f"command_{index}",
+        [[0, f"message {m} of command {index}"] for m in range(messages)],
+        None,
+        [False, False, True, True],
+        1,
+        ("goal " * (state_size // 5 + 1))[:state_size],
+        {},
+        [],
+        [position(index + 1, 10 * index + 1), position(index + 1, 10 * index + 9)],
+    ]
+
+
+class MockServer:
+    """
+    Attributes configuring the synthetic responses:
+        commands: the number of command outputs of an `eval`
+        state_size: the length of the proof state of every command output
+        messages: the number of output messages of every command output
+        cpus: the answer of `\\005numcpu`
+    """
+
+    def __init__(self, commands: int = 1, state_size: int = 64, messages: int = 1, cpus: int = 8):
+        self.commands = commands
+        self.state_size = state_size
+        self.messages = messages
+        self.cpus = cpus
+        self.clients = 0
+        self._eval_cache: dict[tuple, bytes] = {}
+        self._server: asyncio.AbstractServer | None = None
+        self._connections: dict[asyncio.Task, asyncio.StreamWriter] = {}
+
+    def eval_response(self) -> bytes:
+        key = (self.commands, self.state_size, self.messages)
+        packed = self._eval_cache.get(key)
+        if packed is None:
+            outputs = [command_output(i, self.state_size, self.messages) for i in range(self.commands)]
+            packed = mp.packb([outputs, None])
+            self._eval_cache = {key: packed}
+        return packed
+
+    def respond(self, command: str, args: list) -> bytes:
+        if command == "\x05eval" or not command.startswith("\x05"):
+            return self.eval_response()
+        if command in ("\x05lex", "\x05lex'", "\x05lex_file"):
+            src = args[0] if command != "\x05lex_file" else ""
+            ret, offset = [], 1
+            for line, text in enumerate(src.splitlines(True)):
+                if text.strip():
+                    ret.append([position(line + 1, offset), text])
+                offset += len(text)
+            return mp.packb([ret, None])
+        if command in ("\x05file", "\x05file_ext"):
+            return mp.packb([[], None])
+        if command == "\x05symbpos":
+            return mp.packb([list(args[0]), None])
+        if command == "\x05numcpu":
+            return mp.packb([self.cpus, None])
+        if command == "\x05session-of":
+            return mp.packb(["HOL", None])
+        if command == "\x05path":
+            master_dir, theory = args[0]
+            return mp.packb([os.path.join(master_dir, theory.split('.')[-1] + ".thy"), None])
+        if command == "\x05thy_header":
+            return mp.packb([["Draft.Test", [["Main", "Main"]], []], None])
+        if command == "\x05rollback":
+            return mp.packb([command_output(0, self.state_size, self.messages), None])
+        if command == "\x05history":
+            return mp.packb([{}, None])
+        if command == "\x05hammer":
+            return mp.packb(["simp", None])
+        if command == "\x05premise_selection":
+            number = args[0][0]
+            return mp.packb([{f"lemma_{i}": f"P {i}" for i in range(number)}, None])
+        return mp.packb([None, None])
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        task = asyncio.current_task()
+        assert task is not None
+        self._connections[task] = writer
+        unpacker = mp.Unpacker(unicode_errors='replace')
+        deflate = None
+
+        async def receive():
+            while True:
+                try:
+                    return unpacker.unpack()
+                except mp.OutOfData:
+                    data = await reader.read(65536)
+                    if not data:
+                        raise EOFError
+                    unpacker.feed(data)
+
+        def send(data: bytes):
+            if deflate is not None:
+                data = deflate.compress(data) + deflate.flush(zlib.Z_SYNC_FLUSH)
+            writer.write(data)
+
+        try:
+            first = await receive()
+            if first == "heartbeat":
+                send(mp.packb([None, None]))
+                return
+            if first == "metrics":
+                send(mp.packb([f"isa_repl_active_clients {self.clients}\n", None]))
+                return
+            if isinstance(first, str) and first.startswith("kill "):
+                send(mp.packb([False, None]))
+                return
+            features = first.split(';')[1:] if isinstance(first, str) else []
+            if any(f.startswith('zlib') for f in features): # every response, including the handshake
+                deflate = zlib.compressobj(wbits=-zlib.MAX_WBITS)
+            await receive() # the theory qualifier
+            self.clients += 1
+            send(mp.packb([[os.getpid(), self.clients], None]))
+            while True:
+                await writer.drain()
+                command = await receive()
+                if command == "\x05cancel":
+                    continue
+                if not isinstance(command, str):
+                    send(mp.packb([None, "bad request"]))
+                    continue
+                if command.startswith("\x05") and command not in ARITY:
+                    send(mp.packb([None, f"unsupported command {command[1:]}"]))
+                    return
+                args = [await receive() for _ in range(ARITY.get(command, 0))]
+                send(self.respond(command, args))
+        except (EOFError, ConnectionError):
+            pass
+        finally:
+            del self._connections[task]
+            try:
+                await writer.drain()
+                writer.close()
+            except ConnectionError:
+                pass
+
+    async def start(self, addr: str = "127.0.0.1:0") -> str:
+        """Listen on `addr` (`host:port`, where port 0 picks a free one, or `unix:/path`), returning the address"""
+        if addr.startswith("unix:"):
+            path = addr[len("unix:"):]
+            if os.path.exists(path):
+                os.remove(path)
+            self._server = await asyncio.start_unix_server(self._handle, path)
+            return addr
+        host, port = addr.rsplit(':', 1)
+        self._server = await asyncio.start_server(self._handle, host, int(port))
+        port = self._server.sockets[0].getsockname()[1]
+        return f"{host}:{port}"
+
+    async def stop(self):
+        if self._server is not None:
+            self._server.close()
+            tasks = list(self._connections)
+            for writer in self._connections.values():
+                writer.close() # the handlers see the end of the stream
+            await asyncio.gather(*tasks, return_exceptions=True)
+            await self._server.wait_closed()
+            self._server = None
+
+
+async def _serve(addr: str, server: MockServer):
+    addr = await server.start(addr)
+    print(f"mock REPL server listening on {addr}", flush=True)
+    await asyncio.Event().wait()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m benchmarks.mock_server',
+                                     description="A mock REPL server with synthetic responses")
+    parser.add_argument('address', nargs='?', default='127.0.0.1:6666')
+    parser.add_argument('--commands', type=int, default=1, help="command outputs per eval")
+    parser.add_argument('--state-size', type=int, default=64, help="characters of every proof state")
+    parser.add_argument('--messages', type=int, default=1, help="messages of every command output")
+    args = parser.parse_args(argv)
+    try:
+        asyncio.run(_serve(args.address, MockServer(args.commands, args.state_size, args.messages)))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()
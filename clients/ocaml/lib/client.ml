@@ -46,12 +46,34 @@ type eval_result = {
   error : string option;
 }
 
+(** Incremental msgpack decoder.
+
+    Bytes are kept in [buf.[pos .. len)], where [buf] grows geometrically.
+    The structure of the next value is scanned from [scan] on, with
+    [open_items] the numbers of items still expected by the enclosing arrays
+    and maps, so that every byte is scanned once however the value is split
+    over reads. The value is decoded only once it is complete. *)
+type decoder = {
+  mutable buf : Bytes.t;
+  mutable pos : int;
+  mutable len : int;
+  mutable scan : int;
+  mutable open_items : int list;
+}
+
+(** Msgpack reader over an input channel *)
+type reader = {
+  ic : in_channel;
+  dec : decoder;
+}
+
 (** Client connection *)
 type t = {
   addr : string;
   sock : Unix.file_descr;
   cin : in_channel;
   cout : out_channel;
+  reader : reader;
   pid : int;
   client_id : int;
   mutable closed : bool;
@@ -60,43 +82,132 @@ type t = {
 (** Global client registry *)
 let clients : (int, t) Hashtbl.t = Hashtbl.create 10
 
-(** Write msgpack to out_channel *)
-let write_msgpack oc msg =
+(** Write msgpack values to out_channel, flushing once *)
+let write_msgpacks oc msgs =
   let buf = Buffer.create 1024 in
-  let _ = Msgpck.StringBuf.write buf msg in
-  output_string oc (Buffer.contents buf);
+  List.iter (fun msg -> ignore (Msgpck.StringBuf.write buf msg)) msgs;
+  Buffer.output_buffer oc buf;
   flush oc
 
-(** Read msgpack from in_channel *)
-let read_msgpack ic =
-  (* Read all available data into a buffer *)
-  let buf = Buffer.create 4096 in
-  let chunk_size = 4096 in
-  let chunk = Bytes.create chunk_size in
-
-  (* Read at least some data *)
-  let n = input ic chunk 0 1 in
-  if n = 0 then raise End_of_file;
-  Buffer.add_subbytes buf chunk 0 n;
-
-  (* Try to parse, if we need more data, read more *)
-  let rec try_parse () =
-    let str = Buffer.contents buf in
-    try
-      let (bytes_read, msg) = Msgpck.StringBuf.read str in
-      if bytes_read < String.length str then
-        (* We read more than needed, that's ok *)
-        msg
-      else
-        msg
-    with Invalid_argument _ ->
-      (* Need more data *)
-      let n = input ic chunk 0 chunk_size in
-      if n = 0 then raise End_of_file;
-      Buffer.add_subbytes buf chunk 0 n;
-      try_parse ()
+(** Write msgpack to out_channel *)
+let write_msgpack oc msg = write_msgpacks oc [msg]
+
+(** Create an empty decoder *)
+let make_decoder () = {
+  buf = Bytes.create 65536;
+  pos = 0;
+  len = 0;
+  scan = 0;
+  open_items = [1];
+}
+
+(** Create a reader of msgpack values from in_channel *)
+let make_reader ic = { ic; dec = make_decoder () }
+
+(** Big-endian unsigned integer of [n] bytes at [p] *)
+let get_uint buf p n =
+  let rec go i acc = if i = n then acc else go (i + 1) ((acc lsl 8) lor Bytes.get_uint8 buf (p + i)) in
+  go 0 0
+
+(** [Some (size, items)] of the msgpack item at [p], where [size] covers its
+    header and payload, and [items] is the number of values it contains;
+    [None] if the [avail] bytes from [p] do not hold it yet *)
+let item_size buf p avail =
+  if avail < 1 then None else
+  let sized header n items =
+    if avail < header then None
+    else Some (header, get_uint buf (p + 1) n * items)
   in
-  try_parse ()
+  let with_payload header n =
+    if avail < header then None
+    else let size = header + get_uint buf (p + 1) n in
+         if avail < size then None else Some (size, 0)
+  in
+  let fixed size = if avail < size then None else Some (size, 0) in
+  match Bytes.get_uint8 buf p with
+  | b when b <= 0x7f || b >= 0xe0 -> Some (1, 0)
+  | b when b <= 0x8f -> Some (1, 2 * (b land 0x0f))
+  | b when b <= 0x9f -> Some (1, b land 0x0f)
+  | b when b <= 0xbf -> fixed (1 + (b land 0x1f))
+  | 0xc0 | 0xc2 | 0xc3 -> Some (1, 0)
+  | 0xc4 | 0xd9 -> with_payload 2 1
+  | 0xc5 | 0xda -> with_payload 3 2
+  | 0xc6 | 0xdb -> with_payload 5 4
+  | 0xc7 -> (match with_payload 2 1 with Some (size, _) -> fixed (size + 1) | None -> None)
+  | 0xc8 -> (match with_payload 3 2 with Some (size, _) -> fixed (size + 1) | None -> None)
+  | 0xc9 -> (match with_payload 5 4 with Some (size, _) -> fixed (size + 1) | None -> None)
+  | 0xca | 0xce | 0xd2 -> fixed 5
+  | 0xcb | 0xcf | 0xd3 -> fixed 9
+  | 0xcc | 0xd0 -> fixed 2
+  | 0xcd | 0xd1 -> fixed 3
+  | 0xd4 -> fixed 3
+  | 0xd5 -> fixed 4
+  | 0xd6 -> fixed 6
+  | 0xd7 -> fixed 10
+  | 0xd8 -> fixed 18
+  | 0xdc -> sized 3 2 1
+  | 0xdd -> sized 5 4 1
+  | 0xde -> sized 3 2 2
+  | 0xdf -> sized 5 4 2
+  | _ -> raise (REPLFail "Invalid msgpack data from the server")
+
+(** Scan the next value as far as the buffered bytes go; true if it is complete *)
+let rec scan_value r =
+  let rec pop = function 0 :: rest -> pop rest | l -> l in
+  match r.open_items with
+  | [] -> true
+  | n :: rest ->
+      match item_size r.buf r.scan (r.len - r.scan) with
+      | None -> false
+      | Some (size, items) ->
+          r.scan <- r.scan + size;
+          r.open_items <- pop (if items > 0 then items :: (n - 1) :: rest else (n - 1) :: rest);
+          scan_value r
+
+(** Make room for at least [n] more bytes after [len], compacting the buffer
+    or doubling its size *)
+let reserve d n =
+  let cap = Bytes.length d.buf in
+  if d.len + n > cap then begin
+    let live = d.len - d.pos in
+    let cap' = if 2 * (live + n) <= cap then cap else max (2 * cap) (live + n) in
+    let buf = if cap' = cap then d.buf else Bytes.create cap' in
+    Bytes.blit d.buf d.pos buf 0 live;
+    d.buf <- buf;
+    d.scan <- d.scan - d.pos;
+    d.len <- live;
+    d.pos <- 0
+  end
+
+(** Append [n] bytes of [src] from [off] *)
+let feed d src off n =
+  reserve d n;
+  Bytes.blit src off d.buf d.len n;
+  d.len <- d.len + n
+
+(** The next msgpack value if it is complete *)
+let decode d =
+  if not (scan_value d) then None
+  else begin
+    let (_, msg) = Msgpck.Bytes.read ~pos:d.pos d.buf in
+    d.pos <- d.scan;
+    if d.pos = d.len then begin d.pos <- 0; d.len <- 0 end;
+    d.scan <- d.pos;
+    d.open_items <- [1];
+    Some msg
+  end
+
+(** Read the next msgpack value *)
+let rec read_msgpack r =
+  match decode r.dec with
+  | Some msg -> msg
+  | None ->
+      let d = r.dec in
+      if d.len = Bytes.length d.buf then reserve d 1;
+      let n = input r.ic d.buf d.len (Bytes.length d.buf - d.len) in
+      if n = 0 then raise End_of_file;
+      d.len <- d.len + n;
+      read_msgpack r
 
 (** Parse control message *)
 let parse_control msg =
@@ -112,33 +223,44 @@ let check_alive client =
   if client.closed then
     raise (REPLFail (Printf.sprintf "Client %d is dead or closed" client.client_id))
 
-(** Create a new client and connect to the server *)
-let create ?(timeout=3600.0) addr thy_qualifier =
-  let parse_addr s =
-    match String.split_on_char ':' s with
-    | [host; port] -> (host, int_of_string port)
-    | _ -> raise (Invalid_argument "Invalid address format, expected host:port")
-  in
-  let (host, port) = parse_addr addr in
-
-  (* Create socket with timeout *)
-  let sock = Unix.socket Unix.PF_INET Unix.SOCK_STREAM 0 in
+(** Socket domain and address of [addr], either "host:port" or "unix:/path"
+    of a Unix domain socket *)
+let sockaddr_of_string addr =
+  let prefix = "unix:" in
+  let plen = String.length prefix in
+  if String.length addr > plen && String.sub addr 0 plen = prefix then
+    (Unix.PF_UNIX, Unix.ADDR_UNIX (String.sub addr plen (String.length addr - plen)))
+  else
+    match String.split_on_char ':' addr with
+    | [host; port] ->
+        let host_entry = Unix.gethostbyname host in
+        (Unix.PF_INET, Unix.ADDR_INET (host_entry.Unix.h_addr_list.(0), int_of_string port))
+    | _ -> raise (Invalid_argument "Invalid address format, expected host:port or unix:path")
+
+(** Connect a socket with timeout to [addr] (see [sockaddr_of_string]) *)
+let connect_socket timeout addr =
+  let (domain, server_addr) = sockaddr_of_string addr in
+  let sock = Unix.socket domain Unix.SOCK_STREAM 0 in
   Unix.setsockopt_float sock Unix.SO_RCVTIMEO timeout;
   Unix.setsockopt_float sock Unix.SO_SNDTIMEO timeout;
-
-  let host_entry = Unix.gethostbyname host in
-  let server_addr = Unix.ADDR_INET (host_entry.Unix.h_addr_list.(0), port) in
+  (* Requests are small; do not let Nagle's algorithm delay them *)
+  if domain = Unix.PF_INET then Unix.setsockopt sock Unix.TCP_NODELAY true;
   Unix.connect sock server_addr;
+  sock
+
+(** Create a new client and connect to the server *)
+let create ?(timeout=3600.0) addr thy_qualifier =
+  let sock = connect_socket timeout addr in
 
   let cin = Unix.in_channel_of_descr sock in
   let cout = Unix.out_channel_of_descr sock in
+  let reader = make_reader cin in
 
   (* Send version and qualifier *)
-  write_msgpack cout (Msgpck.of_string version);
-  write_msgpack cout (Msgpck.of_string thy_qualifier);
+  write_msgpacks cout [Msgpck.of_string version; Msgpck.of_string thy_qualifier];
 
   (* Receive response *)
-  let response = read_msgpack cin in
+  let response = read_msgpack reader in
 
   let (pid, client_id) = match parse_control response with
     | Msgpck.List [Msgpck.Int pid; Msgpck.Int cid] -> (pid, cid)
@@ -158,6 +280,7 @@ let create ?(timeout=3600.0) addr thy_qualifier =
     sock;
     cin;
     cout;
+    reader;
     pid;
     client_id;
     closed = false;
@@ -179,7 +302,20 @@ let close client =
 let send_command client cmd =
   check_alive client;
   write_msgpack client.cout cmd;
-  parse_control (read_msgpack client.cin)
+  parse_control (read_msgpack client.reader)
+
+(** Send several requests at once, each given as the sequence of its msgpack
+    values, then read their responses in order. The server answers the
+    requests of a connection one by one, so this saves a round trip per
+    request. Every response is read even if some fail. *)
+let pipeline client requests =
+  check_alive client;
+  write_msgpacks client.cout (List.concat requests);
+  List.map (fun _ ->
+    match parse_control (read_msgpack client.reader) with
+    | result -> Ok result
+    | exception REPLFail err -> Error err
+  ) requests
 
 (** Evaluate source code *)
 let eval ?timeout ?cmd_timeout ?import_dir client source =
@@ -212,35 +348,35 @@ let set_register_thy client value =
 let lex client source =
   write_msgpack client.cout (Msgpck.of_string "\x05lex");
   write_msgpack client.cout (Msgpck.of_string source);
-  let response = read_msgpack client.cin in
+  let response = read_msgpack client.reader in
   parse_control response
 
 (** Fast lex (using system keywords only) *)
 let fast_lex client source =
   write_msgpack client.cout (Msgpck.of_string "\x05lex'");
   write_msgpack client.cout (Msgpck.of_string source);
-  let response = read_msgpack client.cin in
+  let response = read_msgpack client.reader in
   parse_control response
 
 (** Lex a file *)
 let lex_file client file =
   write_msgpack client.cout (Msgpck.of_string "\x05lex_file");
   write_msgpack client.cout (Msgpck.of_string file);
-  let response = read_msgpack client.cin in
+  let response = read_msgpack client.reader in
   parse_control response
 
 (** Record current state *)
 let record_state client name =
   write_msgpack client.cout (Msgpck.of_string "\x05record");
   write_msgpack client.cout (Msgpck.of_string name);
-  let response = read_msgpack client.cin in
+  let response = read_msgpack client.reader in
   let _ = parse_control response in
   ()
 
 (** Clean history *)
 let clean_history client =
   write_msgpack client.cout (Msgpck.of_string "\x05clean_history");
-  let response = read_msgpack client.cin in
+  let response = read_msgpack client.reader in
   let _ = parse_control response in
   ()
 
@@ -248,13 +384,13 @@ let clean_history client =
 let rollback client name =
   write_msgpack client.cout (Msgpck.of_string "\x05rollback");
   write_msgpack client.cout (Msgpck.of_string name);
-  let response = read_msgpack client.cin in
+  let response = read_msgpack client.reader in
   parse_control response
 
 (** Get history of recorded states *)
 let history client =
   write_msgpack client.cout (Msgpck.of_string "\x05history");
-  let response = read_msgpack client.cin in
+  let response = read_msgpack client.reader in
   parse_control response
 
 (** Install a plugin *)
@@ -263,14 +399,14 @@ let plugin client ~name ~ml_code ?(thy="Isa_REPL.Isa_REPL") () =
   write_msgpack client.cout (Msgpck.of_string thy);
   write_msgpack client.cout (Msgpck.of_string name);
   write_msgpack client.cout (Msgpck.of_string ml_code);
-  let response = read_msgpack client.cin in
+  let response = read_msgpack client.reader in
   parse_control response
 
 (** Remove a plugin *)
 let unplugin client name =
   write_msgpack client.cout (Msgpck.of_string "\x05unplugin");
   write_msgpack client.cout (Msgpck.of_string name);
-  let response = read_msgpack client.cin in
+  let response = read_msgpack client.reader in
   let _ = parse_control response in
   ()
 
@@ -278,42 +414,42 @@ let unplugin client name =
 let sexpr_term client term =
   write_msgpack client.cout (Msgpck.of_string "\x05sexpr_term");
   write_msgpack client.cout (Msgpck.of_string term);
-  let response = read_msgpack client.cin in
+  let response = read_msgpack client.reader in
   parse_control response
 
 (** Retrieve facts *)
 let fact client names =
   write_msgpack client.cout (Msgpck.of_string "\x05fact");
   write_msgpack client.cout (Msgpck.of_string names);
-  let response = read_msgpack client.cin in
+  let response = read_msgpack client.reader in
   parse_control response
 
 (** Retrieve facts as S-expressions *)
 let sexpr_fact client names =
   write_msgpack client.cout (Msgpck.of_string "\x05sexpr_fact");
   write_msgpack client.cout (Msgpck.of_string names);
-  let response = read_msgpack client.cin in
+  let response = read_msgpack client.reader in
   parse_control response
 
 (** Invoke sledgehammer *)
 let hammer client timeout =
   write_msgpack client.cout (Msgpck.of_string "\x05hammer");
   write_msgpack client.cout (Msgpck.of_int timeout);
-  let response = read_msgpack client.cin in
+  let response = read_msgpack client.reader in
   parse_control response
 
 (** Get proof context *)
 let context ?(pp="pretty") client =
   write_msgpack client.cout (Msgpck.of_string "\x05context");
   write_msgpack client.cout (Msgpck.of_string pp);
-  let response = read_msgpack client.cin in
+  let response = read_msgpack client.reader in
   parse_control response
 
 (** Set theory qualifier *)
 let set_thy_qualifier client thy_qualifier =
   write_msgpack client.cout (Msgpck.of_string "\x05qualifier");
   write_msgpack client.cout (Msgpck.of_string thy_qualifier);
-  let response = read_msgpack client.cin in
+  let response = read_msgpack client.reader in
   let _ = parse_control response in
   ()
 
@@ -321,7 +457,7 @@ let set_thy_qualifier client thy_qualifier =
 let session_name_of client path =
   write_msgpack client.cout (Msgpck.of_string "\x05session-of");
   write_msgpack client.cout (Msgpck.of_string path);
-  let response = read_msgpack client.cin in
+  let response = read_msgpack client.reader in
   parse_control response
 
 (** Load theories *)
@@ -331,7 +467,7 @@ let load_theory client ?(thy_qualifier="") targets =
     Msgpck.of_string thy_qualifier;
     Msgpck.of_list (List.map Msgpck.of_string targets)
   ]);
-  let response = read_msgpack client.cin in
+  let response = read_msgpack client.reader in
   parse_control response
 
 (** Evaluate a file *)
@@ -348,7 +484,7 @@ let file ?(line=(-1)) ?(column=0) ?timeout ?(attrs=[])
     Msgpck.of_bool use_cache;
     Msgpck.of_list (List.map Msgpck.of_string attrs)
   ]);
-  let response = read_msgpack client.cin in
+  let response = read_msgpack client.reader in
   let errs = parse_control response in
   match errs with
   | Msgpck.List [] -> ()
@@ -364,7 +500,7 @@ let file ?(line=(-1)) ?(column=0) ?timeout ?(attrs=[])
 (** Clean file evaluation cache *)
 let clean_cache client =
   write_msgpack client.cout (Msgpck.of_string "\x05clean_cache");
-  let response = read_msgpack client.cin in
+  let response = read_msgpack client.reader in
   let _ = parse_control response in
   ()
 
@@ -372,14 +508,14 @@ let clean_cache client =
 let add_lib client libs =
   write_msgpack client.cout (Msgpck.of_string "\x05addlibs");
   write_msgpack client.cout (Msgpck.of_list (List.map Msgpck.of_string libs));
-  let response = read_msgpack client.cin in
+  let response = read_msgpack client.reader in
   let _ = parse_control response in
   ()
 
 (** Get number of processors *)
 let num_processor client =
   write_msgpack client.cout (Msgpck.of_string "\x05numcpu");
-  let response = read_msgpack client.cin in
+  let response = read_msgpack client.reader in
   match parse_control response with
   | Msgpck.Int n when n > 0 -> n
   | Msgpck.Int _ -> 1
@@ -389,7 +525,7 @@ let num_processor client =
 let set_cmd_timeout client timeout =
   write_msgpack client.cout (Msgpck.of_string "\x05cmd_timeout");
   write_msgpack client.cout (match timeout with Some t -> Msgpck.of_int t | None -> Msgpck.Nil);
-  let response = read_msgpack client.cin in
+  let response = read_msgpack client.reader in
   let _ = parse_control response in
   ()
 
@@ -399,41 +535,21 @@ let kill client =
 
 (** Test server connectivity *)
 let test_server ?(timeout=60.0) addr =
-  let (host, port) =
-    match String.split_on_char ':' addr with
-    | [h; p] -> (h, int_of_string p)
-    | _ -> raise (Invalid_argument "Invalid address format")
-  in
-  let sock = Unix.socket Unix.PF_INET Unix.SOCK_STREAM 0 in
-  Unix.setsockopt_float sock Unix.SO_RCVTIMEO timeout;
-  Unix.setsockopt_float sock Unix.SO_SNDTIMEO timeout;
-  let host_entry = Unix.gethostbyname host in
-  let server_addr = Unix.ADDR_INET (host_entry.Unix.h_addr_list.(0), port) in
-  Unix.connect sock server_addr;
+  let sock = connect_socket timeout addr in
   let cout = Unix.out_channel_of_descr sock in
   let cin = Unix.in_channel_of_descr sock in
   write_msgpack cout (Msgpck.of_string "heartbeat");
-  let response = read_msgpack cin in
+  let response = read_msgpack (make_reader cin) in
   let _ = parse_control response in
   Unix.close sock
 
 (** Kill a client on the server *)
 let kill_client ?(timeout=60.0) addr client_id =
-  let (host, port) =
-    match String.split_on_char ':' addr with
-    | [h; p] -> (h, int_of_string p)
-    | _ -> raise (Invalid_argument "Invalid address format")
-  in
-  let sock = Unix.socket Unix.PF_INET Unix.SOCK_STREAM 0 in
-  Unix.setsockopt_float sock Unix.SO_RCVTIMEO timeout;
-  Unix.setsockopt_float sock Unix.SO_SNDTIMEO timeout;
-  let host_entry = Unix.gethostbyname host in
-  let server_addr = Unix.ADDR_INET (host_entry.Unix.h_addr_list.(0), port) in
-  Unix.connect sock server_addr;
+  let sock = connect_socket timeout addr in
   let cout = Unix.out_channel_of_descr sock in
   let cin = Unix.in_channel_of_descr sock in
   write_msgpack cout (Msgpck.of_string ("kill " ^ string_of_int client_id));
-  let response = read_msgpack cin in
+  let response = read_msgpack (make_reader cin) in
   match parse_control response with
   | Msgpck.Bool b -> b
   | _ -> false
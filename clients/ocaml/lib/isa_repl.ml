@@ -44,6 +44,7 @@ let set_cmd_timeout = Client.set_cmd_timeout
 let kill = Client.kill
 let test_server = Client.test_server
 let kill_client = Client.kill_client
+let pipeline = Client.pipeline
 
 (** Symbol operations *)
 let pretty_unicode = Symbols.pretty_unicode
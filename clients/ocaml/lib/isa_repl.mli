@@ -87,12 +87,28 @@ module Client : sig
     error : string option;
   }
 
+  (** Incremental decoder of msgpack values, decoding a value of [n] bytes
+      in [O(n)] time however its bytes arrive *)
+  type decoder
+
+  val make_decoder : unit -> decoder
+
+  val feed : decoder -> Bytes.t -> int -> int -> unit
+  (** [feed d buf off n] appends [n] bytes of [buf] from [off] *)
+
+  val decode : decoder -> Msgpck.t option
+  (** The next value, if all its bytes have been fed *)
+
+  (** Reader of the msgpack responses from a channel *)
+  type reader
+
   (** Client connection *)
   type t = {
     addr : string;
     sock : Unix.file_descr;
     cin : in_channel;
     cout : out_channel;
+    reader : reader;
     pid : int;
     client_id : int;
     mutable closed : bool;
@@ -100,10 +116,16 @@ module Client : sig
 
   (** {2 Connection Management} *)
 
+  val version : string
+  (** Protocol version sent to the server *)
+
+  val sockaddr_of_string : string -> Unix.socket_domain * Unix.sockaddr
+  (** Resolve a server address, "host:port" or "unix:/path" *)
+
   val create : ?timeout:float -> string -> string -> t
   (** [create ~timeout addr thy_qualifier] creates a new client connection.
 
-      @param addr Server address in format "host:port"
+      @param addr Server address in format "host:port", or "unix:/path" of a Unix domain socket
       @param thy_qualifier Session name for resolving theory names
       @param timeout Connection timeout in seconds (default: 3600.0)
       @return A new client instance
@@ -118,6 +140,22 @@ module Client : sig
   val kill_client : ?timeout:float -> string -> int -> bool
   (** Kill a specific client on the server *)
 
+  (** {2 Raw Requests} *)
+
+  val send_command : t -> Msgpck.t -> Msgpck.t
+  (** Send a request of a single msgpack value and wait for its response *)
+
+  val parse_control : Msgpck.t -> Msgpck.t
+  (** The result of a response, raising [REPLFail] with its error *)
+
+  val pipeline : t -> Msgpck.t list list -> (Msgpck.t, string) result list
+  (** [pipeline client requests] sends all the [requests], each given as the
+      sequence of its msgpack values (e.g. [[of_string "\x05lex"; of_string src]]),
+      before reading their responses in order. Saves a round trip per request.
+      While a request is evaluated with others queued behind it, the server does not
+      notice the client closing the connection or cancelling it.
+  *)
+
   (** {2 Code Evaluation} *)
 
   val eval : ?timeout:int -> ?cmd_timeout:int -> ?import_dir:string ->
@@ -258,6 +296,7 @@ val set_cmd_timeout : client -> int option -> unit
 val kill : client -> unit
 val test_server : ?timeout:float -> string -> unit
 val kill_client : ?timeout:float -> string -> int -> bool
+val pipeline : client -> Msgpck.t list list -> (Msgpck.t, string) result list
 
 (** {1 Symbol Operations} *)
 
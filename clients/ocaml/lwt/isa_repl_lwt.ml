@@ -0,0 +1,264 @@
+(** Non-blocking Isabelle REPL client on Lwt *)
+
+open Lwt.Syntax
+open Isa_repl
+
+(** Client connection *)
+type t = {
+  addr : string;
+  fd : Lwt_unix.file_descr;
+  ic : Lwt_io.input_channel;
+  oc : Lwt_io.output_channel;
+  decoder : Client.decoder;
+  chunk : Bytes.t;
+  lock : Lwt_mutex.t;
+  timeout : float;
+  pid : int;
+  client_id : int;
+  mutable closed : bool;
+}
+
+type client = t
+
+(** Check if client is alive *)
+let check_alive client =
+  if client.closed then
+    Lwt.fail (REPLFail (Printf.sprintf "Client %d is dead or closed" client.client_id))
+  else Lwt.return_unit
+
+(** Connect a socket to [addr], either "host:port" or "unix:/path" *)
+let connect_socket addr =
+  let* (domain, server_addr) = Lwt_preemptive.detach Client.sockaddr_of_string addr in
+  let fd = Lwt_unix.socket domain Unix.SOCK_STREAM 0 in
+  (* Requests are small; do not let Nagle's algorithm delay them *)
+  if domain = Unix.PF_INET then Lwt_unix.setsockopt fd Unix.TCP_NODELAY true;
+  let* () =
+    Lwt.catch (fun () -> Lwt_unix.connect fd server_addr)
+      (fun exn -> let* () = Lwt_unix.close fd in Lwt.fail exn)
+  in
+  Lwt.return fd
+
+(** Write msgpack values, flushing once *)
+let write_msgpacks oc msgs =
+  let buf = Buffer.create 1024 in
+  List.iter (fun msg -> ignore (Msgpck.StringBuf.write buf msg)) msgs;
+  let* () = Lwt_io.write oc (Buffer.contents buf) in
+  Lwt_io.flush oc
+
+(** Read the next msgpack value *)
+let rec read_msgpack ic decoder chunk =
+  match Client.decode decoder with
+  | Some msg -> Lwt.return msg
+  | None ->
+      let* n = Lwt_io.read_into ic chunk 0 (Bytes.length chunk) in
+      if n = 0 then Lwt.fail End_of_file
+      else begin
+        Client.feed decoder chunk 0 n;
+        read_msgpack ic decoder chunk
+      end
+
+(** Close the client connection *)
+let close client =
+  if client.closed then Lwt.return_unit
+  else begin
+    client.closed <- true;
+    Lwt.catch (fun () -> Lwt_unix.close client.fd) (fun _ -> Lwt.return_unit)
+  end
+
+(** Fail with [REPLFail] after [timeout] seconds. A response that does not
+    arrive in time leaves the connection out of sync, so it is closed. *)
+let with_timeout client f =
+  Lwt.catch (fun () -> Lwt_unix.with_timeout client.timeout f)
+    (function
+      | Lwt_unix.Timeout ->
+          let* () = close client in
+          Lwt.fail (REPLFail (Printf.sprintf "Client %d timed out" client.client_id))
+      | exn -> Lwt.fail exn)
+
+(** Send a request, given as the sequence of its msgpack values, and wait for
+    its response. The requests of a client are served one after another. *)
+let request client msgs =
+  let* () = check_alive client in
+  Lwt_mutex.with_lock client.lock (fun () ->
+    let* () = write_msgpacks client.oc msgs in
+    let* response = with_timeout client (fun () ->
+      read_msgpack client.ic client.decoder client.chunk) in
+    Lwt.return (Client.parse_control response))
+
+let request_unit client msgs =
+  let* _ = request client msgs in
+  Lwt.return_unit
+
+(** Send several requests at once, then read their responses in order *)
+let pipeline client requests =
+  let* () = check_alive client in
+  Lwt_mutex.with_lock client.lock (fun () ->
+    let* () = write_msgpacks client.oc (List.concat requests) in
+    with_timeout client (fun () ->
+      Lwt_list.map_s (fun _ ->
+        let* response = read_msgpack client.ic client.decoder client.chunk in
+        match Client.parse_control response with
+        | result -> Lwt.return (Ok result)
+        | exception REPLFail err -> Lwt.return (Error err)
+      ) requests))
+
+let int_of_msgpck = function
+  | Msgpck.Int n -> n
+  | Msgpck.Int32 n | Msgpck.Uint32 n -> Int32.to_int n
+  | Msgpck.Int64 n | Msgpck.Uint64 n -> Int64.to_int n
+  | _ -> raise (REPLFail "Invalid handshake response")
+
+(** Create a new client and connect to the server *)
+let create ?(timeout=3600.0) addr thy_qualifier =
+  let* fd = Lwt_unix.with_timeout timeout (fun () -> connect_socket addr) in
+  let ic = Lwt_io.of_fd ~mode:Lwt_io.Input fd in
+  let oc = Lwt_io.of_fd ~mode:Lwt_io.Output fd in
+  let decoder = Client.make_decoder () in
+  let chunk = Bytes.create 65536 in
+  Lwt.catch (fun () ->
+    Lwt_unix.with_timeout timeout (fun () ->
+      (* Send version and qualifier *)
+      let* () = write_msgpacks oc [Msgpck.of_string Client.version;
+                                   Msgpck.of_string thy_qualifier] in
+      let* response = read_msgpack ic decoder chunk in
+      match Client.parse_control response with
+      | Msgpck.List [pid; cid] ->
+          Lwt.return {
+            addr; fd; ic; oc; decoder; chunk;
+            lock = Lwt_mutex.create ();
+            timeout;
+            pid = int_of_msgpck pid;
+            client_id = int_of_msgpck cid;
+            closed = false;
+          }
+      | _ -> Lwt.fail (REPLFail "Invalid handshake response")))
+    (fun exn ->
+      let* () = Lwt.catch (fun () -> Lwt_unix.close fd) (fun _ -> Lwt.return_unit) in
+      Lwt.fail exn)
+
+let str = Msgpck.of_string
+
+(** Evaluate source code *)
+let eval ?timeout ?cmd_timeout ?import_dir client source =
+  let msg = match timeout, cmd_timeout, import_dir with
+    | None, None, None -> str source
+    | _ ->
+        let opt f = function Some v -> f v | None -> Msgpck.Nil in
+        Msgpck.of_list [
+          str "\x05eval";
+          Msgpck.of_list [str source; opt Msgpck.of_int timeout;
+                          opt Msgpck.of_int cmd_timeout; opt str import_dir]
+        ]
+  in
+  request client [msg]
+
+let set_trace client trace =
+  request_unit client [str (if trace then "\x05trace" else "\x05notrace")]
+
+let set_register_thy client value =
+  request_unit client [str (if value then "\x05register_thy" else "\x05no_register_thy")]
+
+let lex client source = request client [str "\x05lex"; str source]
+let fast_lex client source = request client [str "\x05lex'"; str source]
+let lex_file client file = request client [str "\x05lex_file"; str file]
+let record_state client name = request_unit client [str "\x05record"; str name]
+let clean_history client = request_unit client [str "\x05clean_history"]
+let rollback client name = request client [str "\x05rollback"; str name]
+let history client = request client [str "\x05history"]
+
+let plugin client ~name ~ml_code ?(thy="Isa_REPL.Isa_REPL") () =
+  request client [str "\x05plugin"; str thy; str name; str ml_code]
+
+let unplugin client name = request_unit client [str "\x05unplugin"; str name]
+let sexpr_term client term = request client [str "\x05sexpr_term"; str term]
+let fact client names = request client [str "\x05fact"; str names]
+let sexpr_fact client names = request client [str "\x05sexpr_fact"; str names]
+let hammer client timeout = request client [str "\x05hammer"; Msgpck.of_int timeout]
+let context ?(pp="pretty") client = request client [str "\x05context"; str pp]
+
+let set_thy_qualifier client thy_qualifier =
+  request_unit client [str "\x05qualifier"; str thy_qualifier]
+
+let session_name_of client path = request client [str "\x05session-of"; str path]
+
+let load_theory client ?(thy_qualifier="") targets =
+  request client [str "\x05load";
+                  Msgpck.of_list [str thy_qualifier; Msgpck.of_list (List.map str targets)]]
+
+let file ?(line=(-1)) ?(column=0) ?timeout ?(attrs=[])
+         ?(cache_position=false) ?(use_cache=false) client path =
+  let pos = if line >= 0 then Msgpck.of_list [Msgpck.of_int line; Msgpck.of_int column] else Msgpck.Nil in
+  let timeout_v = match timeout with Some t -> Msgpck.of_int t | None -> Msgpck.Nil in
+  let* errs = request client [str "\x05file"; Msgpck.of_list [
+    str path;
+    pos;
+    timeout_v;
+    Msgpck.of_bool cache_position;
+    Msgpck.of_bool use_cache;
+    Msgpck.of_list (List.map str attrs)
+  ]] in
+  match errs with
+  | Msgpck.List (_ :: _ as errs) ->
+      let err_strs = List.map (function
+        | Msgpck.String s -> s
+        | Msgpck.Bytes b -> b
+        | _ -> ""
+      ) errs in
+      Lwt.fail (REPLFail (String.concat "\n" err_strs))
+  | _ -> Lwt.return_unit
+
+let clean_cache client = request_unit client [str "\x05clean_cache"]
+let add_lib client libs = request_unit client [str "\x05addlibs"; Msgpck.of_list (List.map str libs)]
+
+let num_processor client =
+  let* n = request client [str "\x05numcpu"] in
+  match n with
+  | Msgpck.Int n when n > 0 -> Lwt.return n
+  | _ -> Lwt.return 1
+
+let set_cmd_timeout client timeout =
+  request_unit client [str "\x05cmd_timeout";
+                       (match timeout with Some t -> Msgpck.of_int t | None -> Msgpck.Nil)]
+
+(** Kill the server *)
+let kill client =
+  Unix.kill client.pid Sys.sigkill;
+  Lwt.return_unit
+
+(** Send a single request on a fresh connection *)
+let request_once timeout addr msg =
+  Lwt_unix.with_timeout timeout (fun () ->
+    let* fd = connect_socket addr in
+    Lwt.finalize (fun () ->
+      let ic = Lwt_io.of_fd ~mode:Lwt_io.Input fd in
+      let oc = Lwt_io.of_fd ~mode:Lwt_io.Output fd in
+      let* () = write_msgpacks oc [str msg] in
+      let* response = read_msgpack ic (Client.make_decoder ()) (Bytes.create 4096) in
+      Lwt.return (Client.parse_control response))
+      (fun () -> Lwt.catch (fun () -> Lwt_unix.close fd) (fun _ -> Lwt.return_unit)))
+
+let test_server ?(timeout=60.0) addr =
+  let* _ = request_once timeout addr "heartbeat" in
+  Lwt.return_unit
+
+let kill_client ?(timeout=60.0) addr client_id =
+  let* response = request_once timeout addr ("kill " ^ string_of_int client_id) in
+  match response with
+  | Msgpck.Bool b -> Lwt.return b
+  | _ -> Lwt.return false
+
+(** Pool of clients connected to the same server *)
+module Pool = struct
+  type nonrec t = t Lwt_pool.t
+
+  let create ?timeout ?(size=16) addr thy_qualifier =
+    Lwt_pool.create size
+      ~validate:(fun client -> Lwt.return (not client.closed))
+      ~check:(fun client ok -> ok (not client.closed))
+      ~dispose:close
+      (fun () -> create ?timeout addr thy_qualifier)
+
+  let use = Lwt_pool.use
+
+  let close pool = Lwt_pool.clear pool
+end
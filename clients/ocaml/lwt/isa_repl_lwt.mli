@@ -0,0 +1,96 @@
+(** Non-blocking OCaml client for Isabelle REPL, on Lwt
+
+    The same operations as {!Isa_repl}, returning promises, so that one
+    process can drive many sessions without a system thread each. The
+    requests of one client are served one after another; use several
+    clients, or a {!Pool}, for concurrency.
+
+    Basic usage:
+    {[
+      let main =
+        let open Lwt.Syntax in
+        let* client = Isa_repl_lwt.create "localhost:9000" "HOL" in
+        let* result = Isa_repl_lwt.eval client "lemma \"True\" by auto" in
+        Isa_repl_lwt.close client
+    ]}
+*)
+
+open Isa_repl
+
+(** Client connection *)
+type t
+
+type client = t
+
+(** {1 Connection Management} *)
+
+val create : ?timeout:float -> string -> string -> client Lwt.t
+(** [create ~timeout addr thy_qualifier] creates a new client connection.
+
+    @param addr Server address in format "host:port", or "unix:/path" of a Unix domain socket
+    @param thy_qualifier Session name for resolving theory names
+    @param timeout Seconds to wait for every response (default: 3600.0). A
+           client whose response does not arrive in time is closed.
+*)
+
+val close : client -> unit Lwt.t
+val test_server : ?timeout:float -> string -> unit Lwt.t
+val kill_client : ?timeout:float -> string -> int -> bool Lwt.t
+
+(** {1 Raw Requests} *)
+
+val request : client -> Msgpck.t list -> Msgpck.t Lwt.t
+(** Send a request, given as the sequence of its msgpack values, and wait for its response *)
+
+val pipeline : client -> Msgpck.t list list -> (Msgpck.t, string) result list Lwt.t
+(** Send several requests at once, then read their responses in order.
+    As with [Isa_repl.Client.pipeline], the queued requests hide a closed connection from the
+    server until they are evaluated. *)
+
+(** {1 Client Operations} *)
+
+val eval : ?timeout:int -> ?cmd_timeout:int -> ?import_dir:string ->
+           client -> string -> Msgpck.t Lwt.t
+val lex : client -> string -> Msgpck.t Lwt.t
+val fast_lex : client -> string -> Msgpck.t Lwt.t
+val lex_file : client -> string -> Msgpck.t Lwt.t
+val set_trace : client -> bool -> unit Lwt.t
+val set_register_thy : client -> bool -> unit Lwt.t
+val record_state : client -> string -> unit Lwt.t
+val clean_history : client -> unit Lwt.t
+val rollback : client -> string -> Msgpck.t Lwt.t
+val history : client -> Msgpck.t Lwt.t
+val plugin : client -> name:string -> ml_code:string -> ?thy:string -> unit -> Msgpck.t Lwt.t
+val unplugin : client -> string -> unit Lwt.t
+val sexpr_term : client -> string -> Msgpck.t Lwt.t
+val fact : client -> string -> Msgpck.t Lwt.t
+val sexpr_fact : client -> string -> Msgpck.t Lwt.t
+val hammer : client -> int -> Msgpck.t Lwt.t
+val context : ?pp:string -> client -> Msgpck.t Lwt.t
+val set_thy_qualifier : client -> string -> unit Lwt.t
+val session_name_of : client -> string -> Msgpck.t Lwt.t
+val load_theory : client -> ?thy_qualifier:string -> string list -> Msgpck.t Lwt.t
+val file : ?line:int -> ?column:int -> ?timeout:int -> ?attrs:string list ->
+           ?cache_position:bool -> ?use_cache:bool -> client -> string -> unit Lwt.t
+val clean_cache : client -> unit Lwt.t
+val add_lib : client -> string list -> unit Lwt.t
+val num_processor : client -> int Lwt.t
+val set_cmd_timeout : client -> int option -> unit Lwt.t
+val kill : client -> unit Lwt.t
+
+(** {1 Connection Pool} *)
+
+module Pool : sig
+  (** Clients connected to the same server, created on demand up to a size.
+      Clients closed in use (e.g., after a timeout) are replaced. *)
+  type t
+
+  val create : ?timeout:float -> ?size:int -> string -> string -> t
+  (** [create ~timeout ~size addr thy_qualifier], with [size] 16 by default *)
+
+  val use : t -> (client -> 'a Lwt.t) -> 'a Lwt.t
+  (** Run with a client taken from the pool, waiting if all are in use *)
+
+  val close : t -> unit Lwt.t
+  (** Close the clients not in use *)
+end
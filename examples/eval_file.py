@@ -11,7 +11,7 @@ Example
 
 """
 
-from IsaREPL import Client, REPLFail
+from IsaREPL import SyncClient, REPLFail
 import sys
 
 if len(sys.argv) != 3:
@@ -23,7 +23,7 @@ target, line, column = sys.argv[2].split(':')
 line=int(line)
 column=int(column)
 
-c = Client(addr, 'HOL')
+c = SyncClient(addr, 'HOL')
 c.set_register_thy (False) # preventing the REPL to reigster he evaluated theories
                 # to the Isabelle system. This suppresses the `duplicate exports`
                 # errors.
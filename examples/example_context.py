@@ -9,7 +9,7 @@ This script demonstrates how to retriev the proof context that includes useful c
     fixed term variables (and their types), fixed type variables (and their sorts), and goals.
 """
 
-from IsaREPL import Client
+from IsaREPL import SyncClient
 import json
 import sys
 
@@ -20,7 +20,7 @@ if len(sys.argv) != 2:
 
 addr = sys.argv[1]
 
-c = Client(addr, 'HOL')
+c = SyncClient(addr, 'HOL')
 
 def echo_eval (src):
     print('>>> '.join(src.splitlines(True)))
@@ -5,7 +5,7 @@ USAGE: example_lex.py <ADDRESS OF SERVER>
 Argument <ADDRESS OF SERVER> is necessary.
 """
 
-from IsaREPL import Client
+from IsaREPL import SyncClient
 import json
 import sys
 
@@ -14,7 +14,7 @@ if len(sys.argv) != 2:
     exit(1)
 
 addr = sys.argv[1]
-c = Client(addr, 'Transport')
+c = SyncClient(addr, 'Transport')
 
 print("""
 This example demonstrates how to split a script into a
@@ -5,7 +5,7 @@ USAGE: example_plugin.py <ADDRESS OF SERVER>
 Argument <ADDRESS OF SERVER> is necessary.
 """
 
-from IsaREPL import Client
+from IsaREPL import SyncClient
 import json
 import sys
 
@@ -14,7 +14,7 @@ if len(sys.argv) != 2:
     exit(1)
 
 addr = sys.argv[1]
-c = Client(addr, 'HOL')
+c = SyncClient(addr, 'HOL')
 
 def echo_eval (src):
     print('>>> '.join(src.splitlines(True)))
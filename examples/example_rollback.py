@@ -7,7 +7,7 @@ Argument <ADDRESS OF SERVER> is necessary.
 This script demonstrates the basic usage of state rollback.
 """
 
-from IsaREPL import Client
+from IsaREPL import SyncClient
 import json
 import sys
 
@@ -18,7 +18,7 @@ if len(sys.argv) != 2:
 
 addr = sys.argv[1]
 
-c = Client(addr, 'HOL')
+c = SyncClient(addr, 'HOL')
 
 def pp(x):
     print(json.dumps(x, indent=2))
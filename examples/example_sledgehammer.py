@@ -21,7 +21,7 @@ This <N> only affects the cores for Sledgehammer. The evaluation of each theory
 
 """
 
-from IsaREPL import Client
+from IsaREPL import SyncClient
 import json
 import sys
 
@@ -30,7 +30,7 @@ if len(sys.argv) != 2:
     exit(1)
 
 addr = sys.argv[1]
-c = Client(addr, 'HOL')
+c = SyncClient(addr, 'HOL')
 
 def echo_eval (src):
     print('>>> '.join(src.splitlines(True)))
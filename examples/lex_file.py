@@ -3,7 +3,7 @@ USAGE = """
 USAGE: lex_file.py <ADDRESS OF SERVER> <FILE>
 """
 
-from IsaREPL import Client
+from IsaREPL import SyncClient
 import json
 import sys
 import os
@@ -15,7 +15,7 @@ if len(sys.argv) != 3:
 addr = sys.argv[1]
 file = sys.argv[2]
 
-with Client(addr, 'HOL') as c:
+with SyncClient(addr, 'HOL') as c:
     lex = c.lex_file(file)
     for pos, src in lex:
         print(f"{pos.line}:{pos.column}: {src}")
\ No newline at end of file
@@ -2,7 +2,7 @@
 
 import os
 import sys
-from IsaREPL import Client
+from IsaREPL import SyncClient
 
 USAGE = """
 parse_thy_header.py <ADDRESS OF SERVER> <TARGET ISABELLE THEORY FILE TO PARSE>
@@ -21,7 +21,7 @@ if len(sys.argv) != 3:
 addr = sys.argv[1]
 target = sys.argv[2]
 
-c = Client(addr, 'HOL')
+c = SyncClient(addr, 'HOL')
 s = c.session_name_of(target)
 c.set_thy_qualifier(s)
 with open(target, 'r') as f:
@@ -10,7 +10,7 @@ Example
 
 """
 
-from IsaREPL import Client
+from IsaREPL import SyncClient
 import sys
 
 if len(sys.argv) != 4:
@@ -21,5 +21,5 @@ addr = sys.argv[1]
 theory_name = sys.argv[2]
 master_directory = sys.argv[3]
 
-c = Client(addr, 'HOL')
+c = SyncClient(addr, 'HOL')
 print(c.path_of_theory(theory_name, master_directory))
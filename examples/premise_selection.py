@@ -1,6 +1,6 @@
 #!/usr/bin/env python3
 
-from IsaREPL import Client, REPLFail
+from IsaREPL import SyncClient, REPLFail
 import sys
 
 USAGE = """
@@ -17,7 +17,7 @@ number = int(sys.argv[3])
 methods = sys.argv[4].split(',')
 printer = sys.argv[5]
 
-c = Client(addr, 'HOL')
+c = SyncClient(addr, 'HOL')
 c.set_register_thy (False) # preventing the REPL to reigster he evaluated theories
                 # to the Isabelle system. This suppresses the `duplicate exports`
                 # errors.
@@ -5,12 +5,12 @@ session_of.py <address> <file>
 """
 
 import sys
-from IsaREPL import Client
+from IsaREPL import SyncClient
 
 if len(sys.argv) != 3:
     print(USAGE)
     sys.exit(1)
 
 address, file = sys.argv[1], sys.argv[2]
-with Client(address, 'HOL') as c:
+with SyncClient(address, 'HOL') as c:
     print(c.session_name_of(file))
\ No newline at end of file
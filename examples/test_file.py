@@ -11,7 +11,7 @@ Example
 
 """
 
-from IsaREPL import Client
+from IsaREPL import SyncClient
 import sys
 
 if len(sys.argv) != 3:
@@ -21,7 +21,7 @@ if len(sys.argv) != 3:
 addr   = sys.argv[1]
 target = sys.argv[2]
 
-c = Client(addr, 'HOL')
+c = SyncClient(addr, 'HOL')
 
 session = c.session_name_of (target)
 if session:
@@ -0,0 +1,67 @@
+#!/bin/env python
+
+USAGE = """
+test_plugin_sink.py <ADDRESS OF SERVER> <SINK FILE ON THE SERVER>
+
+Evaluate a proof with the plugin sink, the fingerprints and the timing enabled
+together, checking that the outputs of plugins are redirected to the sink while
+the fingerprints and the timings are still sent through the socket.
+
+Example
+
+./examples/test_plugin_sink.py 127.0.0.1:6666 /tmp/repl_plugin_sink
+"""
+
+from IsaREPL import SyncClient, PluginSinkRef
+import sys
+
+if len(sys.argv) != 3:
+    print(USAGE)
+    exit(1)
+
+addr = sys.argv[1]
+sink = sys.argv[2]
+
+c = SyncClient(addr, 'HOL')
+c.set_register_thy(False)
+c.plugin("NPREMS", """
+fn _ => fn {state=s, ...} => (
+    (if Toplevel.is_proof s
+     then SOME (MessagePackBinIO.Pack.packInt (Thm.nprems_of (#goal (Proof.goal (Toplevel.proof_of s)))))
+     else NONE),
+    NONE)
+""")
+c.set_fingerprint(True)
+c.set_timing(True)
+print("sink file: " + c.set_plugin_sink(sink))
+
+ret = c.eval("""
+theory Test_Plugin_Sink
+  imports Main
+begin
+lemma "rev (rev xs) = xs \\<and> True"
+  apply (rule conjI)
+  apply simp
+  by simp
+end
+""")
+
+for out in ret:
+    if out.errors:
+        print(out.errors)
+        exit(1)
+    if not isinstance(out.fingerprint, str) or not isinstance(out.goal_count, int):
+        print(f"bad fingerprint of {out.command}: {out.fingerprint!r}, {out.goal_count!r}")
+        exit(1)
+    if not isinstance(out.timing, dict):
+        print(f"bad timing of {out.command}: {out.timing!r}")
+        exit(1)
+    for name, ref in out.plugin_output.items():
+        if not isinstance(ref, PluginSinkRef):
+            print(f"the output of plugin {name} is not redirected to the sink: {ref!r}")
+            exit(1)
+
+c.set_plugin_sink(None)
+c.set_timing(False)
+print("success")
+exit(0)
@@ -0,0 +1,66 @@
+#!/bin/env python
+
+USAGE = """
+test_skip_proofs.py <ADDRESS OF SERVER>
+
+Evaluate a theory file with its proofs checked, skipped and forked, covering proofs
+nested by `subgoal` and statements abandoned by `oops`. The theory file is written to
+a temporary directory, which must be accessible to the server.
+
+Example
+
+./examples/test_skip_proofs.py 127.0.0.1:6666
+"""
+
+from IsaREPL import SyncClient
+import os
+import sys
+import tempfile
+
+if len(sys.argv) != 2:
+    print(USAGE)
+    exit(1)
+
+addr = sys.argv[1]
+
+THEORY = """
+theory Test_Skip_Proofs
+  imports Main
+begin
+
+lemma conj_swap: "A \\<and> B \\<longrightarrow> B \\<and> A"
+  apply (rule impI)
+  subgoal
+    apply (erule conjE)
+    apply (rule conjI)
+     apply assumption
+    apply assumption
+    done
+  done
+
+lemma abandoned: "False"
+  oops
+
+lemma abandoned: "True"
+  by simp
+
+lemma after_subgoal: "x = x"
+  subgoal by (rule refl)
+  done
+
+end
+"""
+
+c = SyncClient(addr, 'HOL')
+c.set_register_thy(False)
+
+with tempfile.TemporaryDirectory() as tmp:
+    path = os.path.join(tmp, "Test_Skip_Proofs.thy")
+    with open(path, "w") as file:
+        file.write(THEORY)
+    for proofs in ('check', 'skip', 'fork'):
+        c.file(path, proofs=proofs)
+        print(proofs + ": success")
+
+print("success")
+exit(0)
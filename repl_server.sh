@@ -8,7 +8,8 @@ repl_server <ADDR> <BASE_SESSION> <OUTPUT_DIR> [OPTIONS]
 
 Mandatory Arguments
 
-ADDR          :  The address on which this sever listens, e.g., "127.0.0.1:6666"
+ADDR          :  The address on which this sever listens, e.g., "127.0.0.1:6666",
+                 or "unix:/path/to/socket" for a Unix domain socket
 BASE_SESSION  :  An Isabelle session. Only theories within BASE_SESSION and other sessions
                  indicated by '-l' can be loaded by this shell.
                  Set this to 'HOL' if you have no idea and we strongly refer you to Isabelle's
@@ -20,11 +21,24 @@ OUTPUT_DIR    :  The directory that stores all files generated when running the
 
 Optional Options
 
+ -m METRICS_ADDR  :  Serve the metrics of the server over plain HTTP on METRICS_ADDR,
+                     e.g., "127.0.0.1:9666", in the text format of Prometheus.
+                     The metrics are always available through the REPL protocol.
+
  -l SESSION_NAME  :  Additional sessions to be loaded by this shell.
                      The difference between "-l" and "BASE_SESSION" is that, this shell
-                     could reuse the built cache of the BASE_SESSION but for sessions
-                     indicated by "-l", they must be re-built every single time running
-                     this REPL server.
+                     could reuse the built cache of the BASE_SESSION but theories of sessions
+                     indicated by "-l" are loaded from their sources when they are first
+                     imported, unless they are prebuilt by "-i".
+
+ -i THEORY        :  A theory to be prebuilt into the heap of this shell, e.g.,
+                     "HOL-Library.Multiset". Use it to prebuild the theories of "-l" sessions.
+
+The heap holding BASE_SESSION, Isa_REPL and the theories given by "-i" is built once and
+reused by every later launch with the same BASE_SESSION, "-l" sessions, "-i" theories and
+version of Isa_REPL, so restarts (e.g., by repl_server_watch_dog.sh) take only seconds.
+The heap is stored in \$ISABELLE_HOME_USER/REPL_sessions. Isabelle rebuilds it when any of
+its sources changes, and you could remove the directory to reclaim the space.
 
 ANY OTHER OPTIONS    will pass to <isabelle build> command. So you could use any option
                      accepted by <isabelle build>, e.g., -o thread=6
@@ -42,13 +56,31 @@ MASTER_DIR="$3"
 shift 3
 
 
-# Parse -l arguments
+# Parse -l, -i and -m arguments
 l_values=()
+i_values=()
 other_options=()
+METRICS_ADDR=""
 
 while [[ $# -gt 0 ]]; do
     key="$1"
-    if [[ "$key" == "-l" ]]; then
+    if [[ "$key" == "-m" ]]; then
+        if [[ -n "$2" && "$2" != -* ]]; then
+            METRICS_ADDR="$2"
+            shift 2
+        else
+            echo "ERROR：-m option needs an argument"
+            exit 1
+        fi
+    elif [[ "$key" == "-i" ]]; then
+        if [[ -n "$2" && "$2" != -* ]]; then
+            i_values+=("$2")
+            shift 2
+        else
+            echo "ERROR：-i option needs an argument"
+            exit 1
+        fi
+    elif [[ "$key" == "-l" ]]; then
         if [[ -n "$2" && "$2" != -* ]]; then
             l_values+=("$2")
             shift 2
@@ -70,6 +102,13 @@ for val in "${l_values[@]}"; do
     formatted_l_values+="\"$escaped_val\" "
 done
 
+formatted_i_values=""
+
+for val in "${i_values[@]}"; do
+    escaped_val="${val//\"/\\\"}"
+    formatted_i_values+="\"$escaped_val\" "
+done
+
 options=""
 
 for val in "${other_options[@]}"; do
@@ -82,6 +121,43 @@ echo $options
 echo "Hi, this is Isabelle REPL Server."
 echo "When you see \"Running REPL$$ ...\", it means I am successfully lanched and listening on $ADDR."
 
+# The prebuilt heap is addressed by the content of everything that goes into it:
+# the base session, the "-l" sessions, the "-i" theories, and the sources of Isa_REPL.
+REPL_HOME="$(cd "$(dirname "${BASH_SOURCE[0]}")" && pwd)"
+
+if command -v sha1sum > /dev/null; then
+  sha1() { sha1sum | cut -d ' ' -f 1; }
+else
+  sha1() { shasum -a 1 | cut -d ' ' -f 1; }
+fi
+
+SOURCES_DIGEST="$(cd "$REPL_HOME" && find . \( -name '*.thy' -o -name '*.ML' -o -name '*.sml' -o -name ROOT \) \
+                    -not -path './examples/*' -not -path './clients/*' -print0 \
+                  | LC_ALL=C sort -z | xargs -0 cat | sha1)"
+STABLE_SESSION="REPL_$(printf '%s\n' "$BASE_SESSION" "${l_values[@]}" -- "${i_values[@]}" -- "$SOURCES_DIGEST" \
+                       | sha1 | cut -c 1-16)"
+STABLE_DIR="$(isabelle getenv -b ISABELLE_HOME_USER)/REPL_sessions/$STABLE_SESSION"
+
+if [ ! -f "$STABLE_DIR/ROOT" ]; then
+  mkdir -p "$STABLE_DIR"
+  TMP_DIR="$(mktemp -d "$STABLE_DIR.XXXXXX")"
+  cat <<EOF > "$TMP_DIR/$STABLE_SESSION.thy"
+theory $STABLE_SESSION
+imports "Isa_REPL.Isa_REPL" $formatted_i_values
+begin
+end
+EOF
+  cat <<EOF > "$TMP_DIR/ROOT"
+session $STABLE_SESSION = "$(printf '%b' $BASE_SESSION)"
+ + sessions Isa_REPL Auto_Sledgehammer $formatted_l_values
+   theories $STABLE_SESSION
+EOF
+  # written aside and moved in, so that concurrent launches never see a partial session
+  mv -f "$TMP_DIR/$STABLE_SESSION.thy" "$STABLE_DIR/"
+  mv -f "$TMP_DIR/ROOT" "$STABLE_DIR/"
+  rmdir "$TMP_DIR"
+fi
+
 DIR="$(mktemp -d)"
 
 cat <<EOF > $DIR/REPL$$.thy
@@ -105,7 +181,7 @@ end
 EOF
 
 cat <<EOF > $DIR/ROOT
-session REPL$$ = "$(printf '%b' $BASE_SESSION)"
+session REPL$$ = $STABLE_SESSION
  + sessions Isa_REPL Auto_Sledgehammer $formatted_l_values
    theories REPL$$
 EOF
@@ -123,8 +199,8 @@ if [ -n "$(isabelle getenv -b ISABELLE_RPC_HOME)" ]; then
   options="$options -o isabelle_rpc_dialogue=absent"
 fi
 
-echo isabelle build -D $DIR $options REPL$$
-REPL_DEFAULT_SESSION="$(printf '%b' $BASE_SESSION)" REPL_PID=$$ isabelle build -o quick_and_dirty=true -D $DIR $options REPL$$
+echo isabelle build -d $STABLE_DIR -D $DIR $options REPL$$
+REPL_METRICS_ADDR="$METRICS_ADDR" REPL_DEFAULT_SESSION="$(printf '%b' $BASE_SESSION)" REPL_PID=$$ isabelle build -o quick_and_dirty=true -d "$STABLE_DIR" -D $DIR $options REPL$$
 
 #rm $DIR -r
 